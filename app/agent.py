@@ -1,35 +1,62 @@
+import asyncio
 import os
-import shutil
+import time
 from pathlib import Path
-from typing import Dict, Union
-
-import tiktoken
-from component_creation import (
-    create_loading_component,
-    create_steep_component,
-    create_tea_component,
-)
-from helpers import (
-    SteepContext,
-    file_log,
-    get_available_components,
-    get_paths_from_tsconfig,
-    log,
-    pour_tag,
-    set_import,
-)
-from langchain_community.callbacks.openai_info import get_openai_token_cost_for_model
+from threading import BoundedSemaphore
+from typing import Callable, Dict, Tuple, Union
+
+from cache import GenerationCache
+from component_index import ComponentIndex
+from context_packer import pack_context
+from edit_script import apply_edit_script, parse_edit_script
+from file_sync import sync_file
+from fingerprints import FingerprintIndex
+from generations import Generation, GenerationCancelled
+from helpers import SteepContext, log
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.language_models.llms import BaseLLM
 from langchain_core.messages import AIMessageChunk
-from langchain_core.runnables import RunnableSerializable
+from langchain_core.runnables import Runnable, RunnableSerializable
+from locations import (
+    COMPONENTS_DIRECTORY,
+    NUXT_CONFIGS,
+    get_import_path,
+    get_nuxt_component_name,
+    resolve_component_location,
+)
+from metrics import GenerationMetrics, MetricsRecorder
+from project_index import ProjectIndex
 from prompt import (
     IMPORT_STATEMENT_EXAMPLES,
     LOGICAL_PATH_EXAMPLES,
+    STOP_SEQUENCES,
     make_component_output_parser,
+    parse_component_location,
     write_component_location_prompt,
     write_component_prompt,
+    write_refine_prompt,
+    write_related_components,
 )
+from sfc import Sfc, find_poured_tag, pour_edit
+from streaming import (
+    FenceDetector,
+    JsonObjectDetector,
+    SteepStreamWriter,
+    close_open_block,
+)
+from tokens import count_tokens
+
+
+def json_mode(llm: Union[BaseLLM, BaseChatModel]) -> Runnable:
+    """
+    Makes backends that can only answer with a JSON object, others are left as they are
+    """
+    llm_type = llm._llm_type
+    if llm_type.startswith("ollama"):
+        return llm.bind(format="json")
+    if "openai" in llm_type:
+        return llm.bind(response_format={"type": "json_object"})
+    return llm
 
 
 class TeaAgent:
@@ -37,112 +64,285 @@ class TeaAgent:
     The agent has 2 tasks it is able to do (in order of process):
     1. Steep - steep the tea into a WIP component, this is temporary until the user pours it
     2. Pour - pour the tea into a component, removes the steeped tea
+
+    An agent holds the state of a single job. The slots are shared between agents using the same backend
+    and limit how many of them can stream from it at once, the cache is shared between all agents.
+    Both tasks can also run on an event loop (asteep and apour), where the async slots limit the streams instead.
+    The steep prompt is kept under the token budget, unless it is 0.
+    A tag that already has a component is refined: the model only answers with the changes, unless they don't apply.
+    The components of the project that fit the query best are part of the steep prompt.
+    Every job records how long the model took and how many tokens it used.
     """
 
-    def __init__(self, llm: Union[BaseLLM, BaseChatModel] = None):
+    def __init__(
+        self,
+        llm: Union[BaseLLM, BaseChatModel] = None,
+        slots: BoundedSemaphore = None,
+        async_slots: asyncio.Semaphore = None,
+        cache: GenerationCache = None,
+        fingerprints: FingerprintIndex = None,
+        project_index: ProjectIndex = None,
+        prompt_token_budget: int = 0,
+        metrics: MetricsRecorder = None,
+        refine: bool = True,
+        component_index: ComponentIndex = None,
+        related_components: int = 0,
+    ):
         self.llm = llm
+        self.slots = slots or BoundedSemaphore(1)
+        self.async_slots = async_slots or asyncio.Semaphore(1)
+        self.cache = cache
+        self.fingerprints = fingerprints or FingerprintIndex()
+        self.project_index = project_index
+        self.prompt_token_budget = prompt_token_budget
+        self.metrics = metrics
+        self.refine = refine
+        self.component_index = component_index
+        self.related_components = related_components
         self.input_prompt = None
         self.model_response = None
+        self.cached = False
+        self.retries = 0
+        self.queue_seconds = None
+        self.time_to_first_token = None
+        self.stream_seconds = None
 
-    def print_chunk(self, chunk: str, end: str = ""):
-        if file_log:
-            print(chunk, end=end, flush=True, file=file_log)
-        else:
-            print(chunk, end=end, flush=True)
+    def _model_name(self) -> str:
+        return self.llm.name or self.llm._llm_type
+
+    def _get_cost(self, prompt_tokens: int, completion_tokens: int) -> float | None:
+        """
+        Returns the cost of the tokens in USD, or None for models OpenAI doesn't charge for
+        """
+        # Loading the price list is slow, and there is no price for other backends
+        if "openai" not in self.llm._llm_type:
+            return None
+        from langchain_community.callbacks.openai_info import (
+            get_openai_token_cost_for_model,
+        )
+
+        try:
+            return get_openai_token_cost_for_model(
+                self._model_name(), prompt_tokens
+            ) + get_openai_token_cost_for_model(
+                self._model_name(), completion_tokens, is_completion=True
+            )
+        except ValueError:
+            return None
+
+    def _count_tokens(self) -> Tuple[int, int]:
+        model = self._model_name()
+        return count_tokens(self.input_prompt or "", model), count_tokens(
+            self.model_response or "", model
+        )
 
-    def print_costs(self):
+    def record_metrics(
+        self, kind: str, file_path: str, succeeded: bool, cancelled: bool = False
+    ) -> GenerationMetrics:
         """
-        Prints the cost of the text in USD
+        Logs what the job took and records it, kind is either steep or pour
         """
-        input_cost = self._get_cost(self.input_prompt)
-        output_cost = self._get_cost(self.model_response)
-        log.info(
-            f"The prompt costs: {input_cost} and the response costs: ${output_cost} USD."
+        prompt_tokens, completion_tokens = self._count_tokens()
+        tokens_per_second = None
+        if self.stream_seconds is not None and self.time_to_first_token is not None:
+            decode_seconds = self.stream_seconds - self.time_to_first_token
+            if decode_seconds > 0:
+                tokens_per_second = completion_tokens / decode_seconds
+
+        metrics = GenerationMetrics(
+            timestamp=time.time(),
+            kind=kind,
+            model=self._model_name(),
+            file_path=file_path,
+            succeeded=succeeded,
+            cancelled=cancelled,
+            cached=self.cached,
+            retries=self.retries,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            queue_seconds=self.queue_seconds,
+            time_to_first_token=self.time_to_first_token,
+            stream_seconds=self.stream_seconds,
+            tokens_per_second=tokens_per_second,
+            # A cached response costs nothing
+            cost=(
+                0.0 if self.cached else self._get_cost(prompt_tokens, completion_tokens)
+            ),
         )
-        log.info(f"Total cost: ${input_cost + output_cost} USD.")
 
-    def _get_cost(self, text: str) -> float:
+        summary = f"{kind.capitalize()}: {prompt_tokens} prompt tokens, {completion_tokens} completion tokens"
+        if self.cached:
+            summary += ", cached"
+        if self.stream_seconds is not None:
+            summary += f", {self.stream_seconds:.2f}s"
+        if self.time_to_first_token is not None:
+            summary += f" ({self.time_to_first_token:.2f}s to the first token"
+            if tokens_per_second is not None:
+                summary += f", {tokens_per_second:.1f} tokens/s"
+            summary += ")"
+        if metrics.cost:
+            summary += f", ${metrics.cost:.5f} USD"
+        log.info(summary)
+
+        if self.metrics:
+            self.metrics.record(metrics)
+        return metrics
+
+    def _cache_key(self) -> str:
         """
-        Returns the cost of the text as a float
+        Keys the current prompt by the model and its sampling parameters
         """
-        try:
-            enc = tiktoken.encoding_for_model(self.llm.name)
-            num_tokens = len(enc.encode(text))
-            return get_openai_token_cost_for_model(self.llm.name, num_tokens)
-        except Exception:
-            log.info(f"Can't get cost for model called {self.llm.name}")
-            return 0.00
+        params = {"llm": self.llm._llm_type, **self.llm._identifying_params}
+        return GenerationCache.key(self.input_prompt, params)
+
+    def _get_cached_response(self) -> str | None:
+        if not self.cache:
+            return None
+        response = self.cache.get(self._cache_key())
+        self.cached = response is not None
+        if response is not None:
+            log.info(f"Using cached response ({self.cache.stats()})")
+            self.model_response = response
+        return response
+
+    def _cache_response(self, response: str):
+        """
+        Only call this with responses that were usable, a cached response is never regenerated
+        """
+        if self.cache:
+            self.cache.put(self._cache_key(), response)
+
+    def _chunk_text(self, chunk: Union[str, AIMessageChunk]) -> str:
+        text = chunk.content if isinstance(chunk, AIMessageChunk) else chunk
+        if not isinstance(text, str):
+            return ""
+        return text
+
+    def _finish_response(self, response: str, generation: Generation = None) -> str:
+        if generation:
+            generation.check()
 
-    def _process_response(
-        self, chain: RunnableSerializable, args: Union[Dict, str]
-    ) -> str:
-        response = ""
-        for chunk in chain.stream(args):
-            if isinstance(chunk, str):
-                self.print_chunk(chunk)
-                response += chunk
-            elif isinstance(chunk, AIMessageChunk):
-                self.print_chunk(chunk.content)
-                response += chunk.content
-
-        self.print_chunk("\n-------\n")
         self.model_response = response
-        log.debug(self.model_response)
+        # Steeps run at the same time, so the whole response is logged with the tag it is for
+        if generation:
+            file_path, steep_id = generation.key
+            log.debug(f"Response for steep {steep_id} of {file_path}:\n{response}")
+        else:
+            log.debug(f"Response:\n{response}")
         return self.model_response
 
-    def pour(self, component_name: str, ctx: SteepContext):
-        log.info("Pouring tea...")
-        # Get the root files
-        component_location_parser = make_component_output_parser()
+    def _process_response(
+        self,
+        chain: RunnableSerializable,
+        args: Union[Dict, str],
+        generation: Generation = None,
+        on_response: Callable[[str], None] = None,
+        detector: FenceDetector | JsonObjectDetector = None,
+    ) -> str:
+        """
+        Streams the response of the chain until the first code fence closes, anything after it is just chatter.
+        on_response is called with the response so far after every chunk.
+        A JsonObjectDetector stops it once the first JSON object closes instead.
+        """
+        response = ""
+        detector = detector or FenceDetector()
+        queued = time.perf_counter()
+        with self.slots:
+            started = time.perf_counter()
+            self.queue_seconds = started - queued
+            self.time_to_first_token = None
+            if generation:
+                generation.check()
+            stream = chain.stream(args)
+            try:
+                for chunk in stream:
+                    if self.time_to_first_token is None:
+                        self.time_to_first_token = time.perf_counter() - started
+                    # Stop streaming as soon as a newer save supersedes this generation
+                    if generation and generation.cancelled:
+                        break
+                    response += self._chunk_text(chunk)
+                    if on_response:
+                        on_response(response)
+                    if detector.feed(response):
+                        break
+            finally:
+                # Closing the stream drops the request, so the backend stops generating
+                stream.close()
+                self.stream_seconds = time.perf_counter() - started
+
+        return self._finish_response(response, generation)
+
+    async def _aprocess_response(
+        self,
+        chain: RunnableSerializable,
+        args: Union[Dict, str],
+        generation: Generation = None,
+        on_response: Callable[[str], None] = None,
+        detector: FenceDetector | JsonObjectDetector = None,
+    ) -> str:
+        """
+        Same as _process_response, but waits on the event loop instead of blocking a thread
+        """
+        response = ""
+        detector = detector or FenceDetector()
+        queued = time.perf_counter()
+        async with self.async_slots:
+            started = time.perf_counter()
+            self.queue_seconds = started - queued
+            self.time_to_first_token = None
+            if generation:
+                generation.check()
+            stream = chain.astream(args)
+            try:
+                async for chunk in stream:
+                    if self.time_to_first_token is None:
+                        self.time_to_first_token = time.perf_counter() - started
+                    if generation and generation.cancelled:
+                        break
+                    response += self._chunk_text(chunk)
+                    if on_response:
+                        on_response(response)
+                    if detector.feed(response):
+                        break
+            finally:
+                await stream.aclose()
+                self.stream_seconds = time.perf_counter() - started
+
+        return self._finish_response(response, generation)
+
+    def _write_pour_prompt(
+        self, component_name: str, ctx: SteepContext
+    ) -> Tuple[RunnableSerializable, Dict]:
+        """
+        Builds the prompt asking where the component goes, returns the chain and its arguments
+        """
         component_location_prompt = write_component_location_prompt(
-            component_location_parser
-        )
-        paths = get_paths_from_tsconfig(ctx.root_directory)
-        self.input_prompt = component_location_prompt.format(
-            **{
-                "component_name": component_name,
-                "path_aliases": paths,
-                "root_files": os.listdir(ctx.root_directory),
-                "parent_component_path": ctx.file_path,
-                "root_path": ctx.root_directory,
-                "logical_path_examples": LOGICAL_PATH_EXAMPLES,
-                "import_statement_examples": IMPORT_STATEMENT_EXAMPLES,
-            }
+            make_component_output_parser()
         )
+        project_index = self.project_index or ProjectIndex(ctx.root_directory)
+        args = {
+            "component_name": component_name,
+            "path_aliases": project_index.tsconfig_paths(),
+            "root_files": project_index.root_files(),
+            "parent_component_path": ctx.file_path,
+            "root_path": ctx.root_directory,
+            "logical_path_examples": LOGICAL_PATH_EXAMPLES,
+            "import_statement_examples": IMPORT_STATEMENT_EXAMPLES,
+        }
+        self.input_prompt = component_location_prompt.format(**args)
         log.debug("Using the following prompt:")
         log.debug(self.input_prompt)
 
-        chain = component_location_prompt | self.llm
+        return component_location_prompt | json_mode(self.llm), args
 
-        def handle_response(retries=2):
-            """
-            Retry in case the model tries to do something stupid
-            """
-            full_response = self._process_response(
-                chain,
-                {
-                    "component_name": component_name,
-                    "path_aliases": paths,
-                    "root_files": os.listdir(ctx.root_directory),
-                    "parent_component_path": ctx.file_path,
-                    "root_path": ctx.root_directory,
-                    "logical_path_examples": LOGICAL_PATH_EXAMPLES,
-                    "import_statement_examples": IMPORT_STATEMENT_EXAMPLES,
-                },
-            )
-            try:
-                output_dict: dict = component_location_parser.parse(full_response)
-                # Defensively protect in case model outputs wrong format
-                if output_dict.get("properties", None) is not None:
-                    output_dict = output_dict["properties"]
-                return output_dict
-            except Exception as e:
-                if retries > 0:
-                    return handle_response(retries - 1)
-                else:
-                    raise e
+    def _parse_location(self, full_response: str, cached: bool) -> dict:
+        output_dict = parse_component_location(full_response)
+        if not cached:
+            self._cache_response(full_response)
+        return output_dict
 
-        output_dict: dict = handle_response()
+    def _write_pour(self, component_name: str, ctx: SteepContext, output_dict: dict):
         log.debug("Output from location path prompt:")
         log.debug(output_dict)
 
@@ -153,7 +353,7 @@ class TeaAgent:
 
         # Add .vue onto the end if the model messed up
         if logical_path[-4:] != ".vue":
-            logical_path += '.vue"'
+            logical_path += ".vue"
 
         # Add .vue onto the end if the model messed up
         if import_statement[-5:] != '.vue"':
@@ -167,83 +367,349 @@ class TeaAgent:
             steeped_content = file.read()
 
         # Write new component
-        with new_component_path.open("w") as file:
-            file.write(steeped_content)
-
-        # Update the import statement and component in the parent component
-        file_content_no_import, _ = set_import(
-            ctx.file_content, ctx.tea_import_statement, remove=True
-        )
-        file_content_with_import, _ = set_import(
-            file_content_no_import, import_statement
-        )
-        final_parent_content = pour_tag(file_content_with_import, component_name)
+        self.fingerprints.write_file(str(new_component_path), steeped_content)
+
+        # Other tags may have been poured since the parent was read, so start from what is on disk
+        with open(ctx.file_path, "r") as file:
+            parent_content = file.read()
+
+        # Update the import statement and component in the parent component in one splice
+        sfc = Sfc(parent_content)
+        poured_tag = find_poured_tag(sfc, component_name)
+        remove = []
+        if not [t for t in sfc.tags if t is not poured_tag]:
+            remove.append(ctx.tea_import_statement)
+        edits = sfc.import_edits(add=[import_statement], remove=remove)
+        if poured_tag is not None:
+            edits.append(pour_edit(sfc, poured_tag, component_name))
+        final_parent_content = sfc.splice(edits)
 
         # Finally, write the updated component to the parent
-        with open(ctx.file_path, "w") as file:
-            file.write(final_parent_content)
+        self.fingerprints.write_file(ctx.file_path, final_parent_content)
 
-        # Remove the teacup directory and everything inside it
-        shutil.rmtree(ctx.path_to_teacup_folder)
+        # Remove the steeped tea, the rest of the cup is cleaned up with the parent
+        os.remove(ctx.steep_path)
 
-    def steep(self, ctx: SteepContext):
+    def _resolve_location(self, component_name: str, ctx: SteepContext) -> dict | None:
         """
-        Writes a temporary component and adds an import to the top of the saved file
+        Picks the location without the model when the project makes it obvious
         """
+        project_index = self.project_index or ProjectIndex(ctx.root_directory)
+        location = resolve_component_location(
+            component_name, ctx.file_path, project_index
+        )
+        if location:
+            log.info(f"Pouring into {location['logical_path']}")
+        return location
 
-        loading_component = create_loading_component()
-        steep_component = create_steep_component()
-        tea_component = create_tea_component()
-        available_components = get_available_components(ctx.root_directory)
+    def pour(self, component_name: str, ctx: SteepContext):
+        log.info("Pouring tea...")
+        location = self._resolve_location(component_name, ctx)
+        if location:
+            self._write_pour(component_name, ctx, location)
+            return
 
-        self.input_prompt = write_component_prompt(
-            user_query=ctx.tea_tag.children,
-            steep_component_content=ctx.steep_content,
-            parent_file_content=ctx.file_content,
-            available_components=available_components,
-            packages=ctx.packages.model_dump(exclude_none=True),
-            source_file=ctx.steep_path,
-        )
-        log.debug("Steeping with the following prompt:")
-        log.debug(self.input_prompt)
+        chain, args = self._write_pour_prompt(component_name, ctx)
 
-        # Add the import to the top of the file
-        modified = False
-        file_content_with_tea_import, modified = set_import(
-            ctx.file_content, ctx.tea_import_statement
-        )
-        # Write the loading component and container
-        with open(ctx.loading_component_path, "w") as file:
-            file.write(loading_component)
+        def handle_response(retries=1):
+            """
+            Retry in case the model tries to do something stupid
+            """
+            cached_response = self._get_cached_response()
+            full_response = cached_response or self._process_response(
+                chain, args, detector=JsonObjectDetector()
+            )
+            try:
+                return self._parse_location(
+                    full_response, cached=cached_response is not None
+                )
+            except Exception as e:
+                if retries > 0:
+                    self.retries += 1
+                    return handle_response(retries - 1)
+                else:
+                    raise e
 
-        with open(ctx.steep_path, "w") as file:
-            file.write(steep_component)
+        self._write_pour(component_name, ctx, handle_response())
 
-        with open(os.path.join(ctx.path_to_teacup_folder, "Tea.vue"), "w") as file:
-            file.write(tea_component)
+    async def apour(self, component_name: str, ctx: SteepContext):
+        log.info("Pouring tea...")
+        location = self._resolve_location(component_name, ctx)
+        if location:
+            self._write_pour(component_name, ctx, location)
+            return
 
-        # Then write to file_content if modified
-        if modified:
-            with open(ctx.file_path, "w") as file:
-                file.write(file_content_with_tea_import)
+        chain, args = self._write_pour_prompt(component_name, ctx)
 
-        # Now the component is heating, this is where we ask the llm for code
-        log.info("Creating component. This could take a while...")
+        async def handle_response(retries=1):
+            cached_response = self._get_cached_response()
+            full_response = cached_response or await self._aprocess_response(
+                chain, args, detector=JsonObjectDetector()
+            )
+            try:
+                return self._parse_location(
+                    full_response, cached=cached_response is not None
+                )
+            except Exception as e:
+                if retries > 0:
+                    self.retries += 1
+                    return await handle_response(retries - 1)
+                else:
+                    raise e
 
-        full_response = self._process_response(self.llm, self.input_prompt)
+        self._write_pour(component_name, ctx, await handle_response())
+
+    def _related_components(
+        self, ctx: SteepContext, project_index: ProjectIndex
+    ) -> str | None:
+        """
+        Finds the components of the project the query is about, so the model uses them instead of making them up
+        """
+        if not self.component_index or not self.related_components:
+            return None
+        components = self.component_index.search(
+            ctx.tea_tag.children, self.related_components, exclude=[ctx.file_path]
+        )
+        if not components:
+            return None
+
+        root_files = project_index.root_files()
+        nuxt = ".nuxt" in root_files or any(f in root_files for f in NUXT_CONFIGS)
+        aliases = project_index.path_aliases()
+        if not aliases and nuxt:
+            aliases = {"~/": project_index.root_directory}
+        usages = []
+        for component in components:
+            if nuxt and COMPONENTS_DIRECTORY in component.path.split(os.sep):
+                name = get_nuxt_component_name(component.path)
+                usages.append((component.signature(name), None))
+            else:
+                # The steep is poured elsewhere, only an alias import keeps working after that
+                import_path = get_import_path(component.path, ctx.steep_path, aliases)
+                usages.append(
+                    (
+                        component.signature(),
+                        f"import {component.name} from '{import_path}'",
+                    )
+                )
+        log.debug(f"Related components: {[c.name for c in components]}")
+        return write_related_components(usages)
+
+    def _write_steep_prompt(self, ctx: SteepContext, refine: bool = False):
+        project_index = self.project_index or ProjectIndex(ctx.root_directory)
+        available_components = "\n".join(
+            filter(
+                None,
+                [
+                    project_index.available_components(),
+                    self._related_components(ctx, project_index),
+                ],
+            )
+        )
 
+        prompt_args = {
+            "user_query": ctx.tea_tag.children,
+            "steep_component_content": ctx.steep_content,
+            "available_components": available_components,
+            "source_file": ctx.steep_path,
+        }
+        parent_file_content = ctx.file_content
+        packages = ctx.packages.model_dump(exclude_none=True)
+        write_prompt = write_refine_prompt if refine else write_component_prompt
+        if self.prompt_token_budget:
+            # Whatever the parent file and the packages leave of the budget is for the rest of the prompt
+            base_tokens = count_tokens(
+                write_prompt(parent_file_content="", packages={}, **prompt_args),
+                self._model_name(),
+            )
+            packed = pack_context(
+                ctx.file_content,
+                ctx.tea_tag,
+                ctx.packages,
+                budget=self.prompt_token_budget - base_tokens,
+                model=self._model_name(),
+            )
+            if packed.trimmed:
+                log.info(
+                    f"Left {', '.join(packed.trimmed)} out of the prompt to fit it into {self.prompt_token_budget} tokens"
+                )
+            parent_file_content = packed.parent_file_content
+            packages = packed.packages
+
+        self.input_prompt = write_prompt(
+            parent_file_content=parent_file_content, packages=packages, **prompt_args
+        )
+        log.debug("Steeping with the following prompt:")
+        log.debug(self.input_prompt)
+
+    def _write_steep(
+        self,
+        ctx: SteepContext,
+        full_response: str,
+        cached: bool,
+        generation: Generation = None,
+    ) -> bool:
         try:
             # Grab the code from between the backticks
             code = full_response.split("```")[1].strip("\n")
         except Exception as e:
             log.error("Failed to get code from response. Please try again")
             log.error(e)
-            return
+            return False
 
         # If the first 3 letters are "vue" then we need to remove them (It adds it to type the markdown)
         if code[:3] == "vue":
             code = code[4:]  # Also remove newline
 
-        # Once we get the response, we want to write it to the file
-        with open(ctx.steep_path, "w") as file:
-            file.write(code)
+        # A stop sequence ends the response without the closing tag of the last block
+        if full_response.count("```") < 2:
+            code = close_open_block(code)
+
+        # Once we get the response, we want to write it to the file, unless a newer version took over meanwhile
+        if generation and generation.cancelled:
+            return False
+        sync_file(ctx.steep_path, code)
+
+        if not cached:
+            self._cache_response(full_response)
+        return True
+
+    def _write_refined_steep(
+        self,
+        ctx: SteepContext,
+        full_response: str,
+        cached: bool,
+        generation: Generation = None,
+    ) -> bool | None:
+        """
+        Applies the changes the model answered with to the component, returns None when they don't apply
+        """
+        try:
+            code = apply_edit_script(
+                ctx.steep_content, parse_edit_script(full_response)
+            )
+        except ValueError as e:
+            log.warning(f"Failed to apply the changes from the response: {e}")
+            return None
+
+        if generation and generation.cancelled:
+            return False
+        sync_file(ctx.steep_path, code)
+
+        if not cached:
+            self._cache_response(full_response)
+        return True
+
+    def _refine(self, ctx: SteepContext, generation: Generation = None) -> bool | None:
+        """
+        Asks for the changes to the component of the tag, which is much shorter than all of it.
+        The edits only make sense once complete, so nothing is written while they stream.
+        """
+        self._write_steep_prompt(ctx, refine=True)
+        log.info("Refining component...")
+
+        full_response = self._get_cached_response()
+        cached = full_response is not None
+        try:
+            if not cached:
+                full_response = self._process_response(
+                    self.llm, self.input_prompt, generation=generation
+                )
+        except GenerationCancelled as e:
+            log.info(e)
+            return False
+
+        return self._write_refined_steep(ctx, full_response, cached, generation)
+
+    async def _arefine(
+        self, ctx: SteepContext, generation: Generation = None
+    ) -> bool | None:
+        self._write_steep_prompt(ctx, refine=True)
+        log.info("Refining component...")
+
+        full_response = self._get_cached_response()
+        cached = full_response is not None
+        try:
+            if not cached:
+                full_response = await self._aprocess_response(
+                    self.llm, self.input_prompt, generation=generation
+                )
+        except GenerationCancelled as e:
+            log.info(e)
+            return False
+
+        return self._write_refined_steep(ctx, full_response, cached, generation)
+
+    def steep(self, ctx: SteepContext, generation: Generation = None) -> bool:
+        """
+        Generates the component into the steep file of the tag, the cup and the import are already in place.
+        A component the tag already has is refined first, and only generated whole when that fails.
+        A superseded generation stops without writing anything.
+        Returns whether the steep file was written.
+        """
+        if self.refine and ctx.steep_content:
+            refined = self._refine(ctx, generation)
+            if refined is not None:
+                return refined
+            self.retries += 1
+
+        self._write_steep_prompt(ctx)
+
+        # Now the component is heating, this is where we ask the llm for code
+        log.info("Creating component. This could take a while...")
+
+        full_response = self._get_cached_response()
+        cached = full_response is not None
+        # Show the component in the browser block by block while it is generated
+        stream_writer = SteepStreamWriter(ctx.steep_path, previous=ctx.steep_content)
+        steeped = False
+        try:
+            if not cached:
+                # The stop sequences end a whole component, the other prompts answer with something else
+                full_response = self._process_response(
+                    self.llm.bind(stop=STOP_SEQUENCES),
+                    self.input_prompt,
+                    generation=generation,
+                    on_response=stream_writer.feed,
+                )
+            steeped = self._write_steep(ctx, full_response, cached, generation)
+        except GenerationCancelled as e:
+            log.info(e)
+        finally:
+            # A stream that was cancelled or failed halfway leaves nothing to show or build on
+            if not steeped:
+                stream_writer.discard()
+        return steeped
+
+    async def asteep(self, ctx: SteepContext, generation: Generation = None) -> bool:
+        """
+        Same as steep, on the event loop
+        """
+        if self.refine and ctx.steep_content:
+            refined = await self._arefine(ctx, generation)
+            if refined is not None:
+                return refined
+            self.retries += 1
+
+        self._write_steep_prompt(ctx)
+        log.info("Creating component. This could take a while...")
+
+        full_response = self._get_cached_response()
+        cached = full_response is not None
+        stream_writer = SteepStreamWriter(ctx.steep_path, previous=ctx.steep_content)
+        steeped = False
+        try:
+            if not cached:
+                full_response = await self._aprocess_response(
+                    self.llm.bind(stop=STOP_SEQUENCES),
+                    self.input_prompt,
+                    generation=generation,
+                    on_response=stream_writer.feed,
+                )
+            steeped = self._write_steep(ctx, full_response, cached, generation)
+        except GenerationCancelled as e:
+            log.info(e)
+        finally:
+            if not steeped:
+                stream_writer.discard()
+        return steeped
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from threading import Lock
+from typing import Any, Dict
+
+from helpers import log
+
+
+class GenerationCache:
+    """
+    An on-disk cache of model responses, keyed by a hash of the exact prompt and the model parameters.
+    Entries are evicted least recently used first once the cache grows past max_bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        # key -> (size, last used)
+        self._entries: Dict[str, tuple[int, float]] = {}
+        self._size = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".txt"):
+                stat = entry.stat()
+                self._entries[entry.name[:-4]] = (stat.st_size, stat.st_mtime)
+                self._size += stat.st_size
+
+    @staticmethod
+    def key(prompt: str, params: Dict[str, Any]) -> str:
+        """
+        Hashes a prompt together with the parameters of the model it is sent to
+        """
+        payload = json.dumps(
+            {"prompt": prompt, "params": params}, sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".txt")
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), "r") as file:
+                    response = file.read()
+            except OSError:
+                self._forget(key)
+                self.misses += 1
+                return None
+
+            # Bump the entry so it is evicted last
+            now = time.time()
+            os.utime(self._path(key), (now, now))
+            self._entries[key] = (self._entries[key][0], now)
+            self.hits += 1
+            return response
+
+    def put(self, key: str, response: str):
+        data = response.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            # Write through a temp file so a crash never leaves a truncated entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, self._path(key))
+
+            self._forget(key)
+            self._entries[key] = (len(data), time.time())
+            self._size += len(data)
+            self._evict()
+
+    def _forget(self, key: str):
+        size, _ = self._entries.pop(key, (0, 0))
+        self._size -= size
+
+    def _evict(self):
+        if self._size <= self.max_bytes:
+            return
+        for key, _ in sorted(self._entries.items(), key=lambda e: e[1][1]):
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self._forget(key)
+            log.debug(f"Evicted {key} from the generation cache")
+
+    def stats(self) -> str:
+        # Steeps on other threads update the counters meanwhile
+        with self._lock:
+            return f"{self.hits} hits, {self.misses} misses, {len(self._entries)} entries ({self._size} bytes)"
@@ -1,11 +1,30 @@
-def create_tea_component() -> str:
-    return """
+from typing import List
+
+from helpers import STEEP_ID
+
+# Heads a steep file the component is still streaming into, it only counts as steeped once written whole
+PARTIAL_STEEP_MARKER = "<!-- Tea is still steeping this component -->\n"
+
+
+def create_tea_component(steep_ids: List[str], extension: str = "vue") -> str:
+    for steep_id in steep_ids:
+        if not STEEP_ID.match(str(steep_id)):
+            raise ValueError(f"Invalid steep id {steep_id!r}")
+    imports = "\n".join(
+        f"import Steep{steep_id} from './Steep{steep_id}.{extension}'"
+        for steep_id in steep_ids
+    )
+    steeps = ", ".join(f"'{steep_id}': Steep{steep_id}" for steep_id in steep_ids)
+    return f"""
 <script setup>
-import Steep from './Steep.vue'
+{imports}
+
+const props = defineProps({{ steep: {{ type: [String, Number], required: true }} }})
+const steeps = {{ {steeps} }}
 </script>
 
 <template>
-    <Steep></Steep>
+    <component :is="steeps[props.steep]"></component>
 </template>
 """
 
@@ -28,6 +47,15 @@ import Heating from './Heating.vue'
 """
 
 
+def is_steeped(steep_content: str) -> bool:
+    """
+    Whether a steep file holds a whole component, and not the placeholder or a stream that stopped halfway
+    """
+    return steep_content != create_steep_component() and not steep_content.startswith(
+        PARTIAL_STEEP_MARKER
+    )
+
+
 def create_loading_component() -> str:
     return """
 <template>
@@ -0,0 +1,295 @@
+import math
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from threading import Lock
+from typing import Dict, Iterable, List, Tuple
+
+from helpers import log
+from pydantic import BaseModel
+from sfc import Sfc
+
+# Identifiers in code and words in queries, which are split into words at camelCase.
+# Splitting only the distinct tokens is much faster than finding the words in the whole text.
+TOKEN = re.compile(r"[A-Za-z0-9]+")
+WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from in into is it its of on or that the this to with "
+    "div span template script style setup const let var import export default return true false null".split()
+)
+COMMENT = re.compile(r"/\*.*?\*/|//[^\n]*", re.DOTALL)
+STRING = re.compile(r"""(['"`])((?:\\.|(?!\1).)*)\1""", re.DOTALL)
+BRACKETS = {"(": ")", "[": "]", "{": "}"}
+# A key of an object literal or type, e.g. title: String or 'aria-label'?: string
+KEY = re.compile(
+    r"""(?:^|[,;{\n])\s*(?:readonly\s+)?['"]?([A-Za-z_$][\w$-]*)['"]?\s*\??\s*:"""
+)
+# The event of a call signature in a defineEmits type, e.g. (e: 'change', id: number): void
+EMIT_SIGNATURE = re.compile(r"""\(\s*\w+\s*:\s*['"]([^'"]+)['"]""")
+
+# How much the words of the name and the folders count, compared to a word of the code
+NAME_WEIGHT = 3
+# BM25 parameters, the usual defaults
+K1 = 1.2
+B = 0.75
+
+
+def _term(word: str) -> str | None:
+    """
+    The lowercase term a word is searched by, plurals count as their singular
+    """
+    word = word.lower()
+    if len(word) < 2 or word in STOP_WORDS:
+        return None
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=65536)
+def _token_terms(token: str) -> Tuple[str, ...]:
+    return tuple(term for term in map(_term, WORD.findall(token)) if term)
+
+
+def words(text: str) -> List[str]:
+    """
+    Splits text into the terms that are searched for
+    """
+    return [term for token in TOKEN.findall(text) for term in _token_terms(token)]
+
+
+def count_terms(text: str, terms: Counter):
+    """
+    Adds the terms of the text to terms. Most tokens repeat, so they are counted before they are split.
+    """
+    for token, count in Counter(TOKEN.findall(text)).items():
+        for term in _token_terms(token):
+            terms[term] += count
+
+
+def _balanced(code: str, start: int) -> str:
+    """
+    The code between the bracket at start and the one closing it, brackets in strings don't count
+    """
+    closers = [BRACKETS[code[start]]]
+    i = start + 1
+    while i < len(code) and closers:
+        char = code[i]
+        if char in "'\"`":
+            string = STRING.match(code, i)
+            i = string.end() if string else len(code)
+            continue
+        if char in BRACKETS:
+            closers.append(BRACKETS[char])
+        elif char == closers[-1]:
+            closers.pop()
+        i += 1
+    return code[start + 1 : i - 1]
+
+
+def _top_level(code: str) -> str:
+    """
+    Leaves out everything nested in brackets, e.g. the options of every prop
+    """
+    result = []
+    i = 0
+    while i < len(code):
+        char = code[i]
+        if char in "'\"`":
+            string = STRING.match(code, i)
+            end = string.end() if string else len(code)
+            result.append(code[i:end])
+            i = end
+        elif char in BRACKETS:
+            i += len(_balanced(code, i)) + 2
+            result.append(char + BRACKETS[char])
+        else:
+            result.append(char)
+            i += 1
+    return "".join(result)
+
+
+def _names(code: str, start: int) -> List[str]:
+    """
+    The names declared by the array, object or type at start: ['a', 'b'] or { a: String, b?: number }
+    """
+    body = _balanced(code, start)
+    if code[start] == "[":
+        return [m.group(2) for m in STRING.finditer(body)]
+    names = [m.group(1) for m in KEY.finditer(_top_level(body))]
+    return names + [m.group(1) for m in EMIT_SIGNATURE.finditer(body)]
+
+
+def _declared(code: str, macro: str, option: str) -> List[str]:
+    """
+    The props or emits a script declares with defineProps/defineEmits, or in the options API
+    """
+    call = re.search(rf"\b{macro}\s*(<|\()\s*", code)
+    if call:
+        if code[call.end() : call.end() + 1] in ("[", "{"):
+            return _names(code, call.end())
+        # defineProps<Props>(), the type is declared elsewhere in the script
+        type_name = re.match(r"[A-Za-z_$][\w$]*", code[call.end() :])
+        if call.group(1) == "<" and type_name:
+            declaration = re.search(
+                rf"\b(?:interface\s+{type_name.group(0)}\b[^{{]*|type\s+{type_name.group(0)}\s*=\s*)\{{",
+                code,
+            )
+            if declaration:
+                return _names(code, declaration.end() - 1)
+        return []
+    declaration = re.search(rf"\b{option}\s*:\s*([\[{{])", code)
+    return _names(code, declaration.start(1)) if declaration else []
+
+
+class ComponentSignature(BaseModel):
+    name: str
+    path: str
+    props: List[str]
+    emits: List[str]
+
+    def signature(self, name: str = None) -> str:
+        """
+        The component the way it is used, e.g. <UserCard :user @select />
+        """
+        attributes = [f":{prop}" for prop in self.props] + [
+            f"@{emit}" for emit in self.emits
+        ]
+        return f"<{' '.join([name or self.name] + attributes)} />"
+
+
+def read_component(file_path: str, content: str) -> Tuple[ComponentSignature, Counter]:
+    """
+    Gets the signature of a component and the words it is found by
+    """
+    blocks = Sfc(content).blocks
+    script = "\n".join(
+        COMMENT.sub("", content[block.content_start : block.content_end])
+        for block in blocks
+        if block.tag == "script"
+    )
+    component = ComponentSignature(
+        name=os.path.splitext(os.path.basename(file_path))[0],
+        path=file_path,
+        props=list(dict.fromkeys(_declared(script, "defineProps", "props"))),
+        emits=list(dict.fromkeys(_declared(script, "defineEmits", "emits"))),
+    )
+
+    terms = Counter()
+    for block in blocks:
+        # Styles would only add words like color or margin
+        if block.tag != "style":
+            count_terms(content[block.content_start : block.content_end], terms)
+    # The name, the folders and the props say the most about what a component is for
+    folders = os.path.dirname(file_path).split(os.sep)[-3:]
+    for word in words(" ".join([component.name, *folders, *component.props])):
+        terms[word] += NAME_WEIGHT
+    return component, terms
+
+
+class ComponentIndex:
+    """
+    Knows the signature of every component of the project, filled by scanning the project when Tea starts
+    and kept current as files are saved, deleted or moved.
+    Finds the components a query is about with BM25, only looking at the components sharing a word with the query.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._components: Dict[str, ComponentSignature] = {}
+        self._terms: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+
+    def update(self, file_path: str, content: str):
+        if not file_path.endswith(".vue"):
+            return
+        component, terms = read_component(file_path, content)
+        with self._lock:
+            self._forget(file_path)
+            self._components[file_path] = component
+            self._terms[file_path] = terms
+            self._lengths[file_path] = length = sum(terms.values())
+            self._total_length += length
+            for term, count in terms.items():
+                self._postings.setdefault(term, {})[file_path] = count
+
+    def remove(self, path: str):
+        """
+        Forgets a deleted or moved component, or every component in a directory
+        """
+        prefix = os.path.join(path, "")
+        with self._lock:
+            for file_path in [
+                p for p in self._components if p == path or p.startswith(prefix)
+            ]:
+                self._forget(file_path)
+
+    def _forget(self, file_path: str):
+        if file_path not in self._components:
+            return
+        del self._components[file_path]
+        self._total_length -= self._lengths.pop(file_path)
+        for term in self._terms.pop(file_path):
+            postings = self._postings[term]
+            del postings[file_path]
+            if not postings:
+                del self._postings[term]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._components)
+
+    def search(
+        self, query: str, limit: int, exclude: Iterable[str] = ()
+    ) -> List[ComponentSignature]:
+        """
+        The components that fit the query best, best first. Components sharing no word with it aren't returned.
+        """
+        exclude = set(exclude)
+        with self._lock:
+            count = len(self._components)
+            if not count or limit <= 0:
+                return []
+            average_length = self._total_length / count
+            scores: Counter = Counter()
+            for term in set(words(query)):
+                postings = self._postings.get(term, None)
+                if not postings:
+                    continue
+                idf = math.log(
+                    1 + (count - len(postings) + 0.5) / (len(postings) + 0.5)
+                )
+                for file_path, frequency in postings.items():
+                    norm = K1 * (1 - B + B * self._lengths[file_path] / average_length)
+                    scores[file_path] += idf * frequency * (K1 + 1) / (frequency + norm)
+            return [
+                self._components[file_path]
+                for file_path, _ in scores.most_common()
+                if file_path not in exclude
+            ][:limit]
+
+    def scan(self, file_paths: Iterable[str], max_workers: int = 4):
+        """
+        Reads every component, several at a time
+        """
+        started = time.perf_counter()
+
+        def read(file_path: str):
+            try:
+                with open(file_path, "r") as file:
+                    self.update(file_path, file.read())
+            except (OSError, UnicodeDecodeError) as e:
+                log.debug(f"Can't read {file_path}: {e}")
+
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="tea-components"
+        ) as pool:
+            list(pool.map(read, [p for p in file_paths if p.endswith(".vue")]))
+        log.info(
+            f"Indexed {len(self)} components in {time.perf_counter() - started:.2f}s"
+        )
@@ -0,0 +1,206 @@
+import asyncio
+from threading import Lock
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Union
+
+import aiohttp
+import requests
+from helpers import log
+from langchain_community.llms.ollama import Ollama, OllamaEndpointNotFoundError
+from requests.adapters import HTTPAdapter
+
+
+class ConnectionPool:
+    """
+    Keeps the HTTP connections to a backend alive between requests, so connecting is only paid once.
+    Blocking requests share one session, async requests share one session per event loop.
+    """
+
+    def __init__(self, max_connections: int = 8):
+        self.max_connections = max_connections
+        self._lock = Lock()
+        self._session: requests.Session | None = None
+        self._async_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = (
+            {}
+        )
+
+    def session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                self._session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.max_connections
+                )
+                self._session.mount("http://", adapter)
+                self._session.mount("https://", adapter)
+            return self._session
+
+    def async_session(self) -> aiohttp.ClientSession:
+        """
+        Gets the session of the running event loop, aiohttp sessions can't be shared between loops
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._async_sessions.get(loop, None)
+            if session is None or session.closed:
+                session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=self.max_connections)
+                )
+                self._async_sessions[loop] = session
+            return session
+
+    async def aclose(self):
+        """
+        Closes the async session of the running event loop
+        """
+        with self._lock:
+            session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session:
+            await session.close()
+
+    def close(self):
+        with self._lock:
+            if self._session:
+                self._session.close()
+                self._session = None
+
+
+class PooledOllama(Ollama):
+    """
+    The Ollama model, but its requests go through a connection pool instead of opening a new connection every time
+    """
+
+    pool: Optional[Any] = None
+    # How long Ollama keeps the model loaded after a request, e.g. "10m", or its own default when None
+    keep_alive: Optional[Union[int, str]] = None
+
+    def _get_pool(self) -> ConnectionPool:
+        if self.pool is None:
+            self.pool = ConnectionPool()
+        return self.pool
+
+    def _request_payload(
+        self, payload: Any, stop: Optional[List[str]] = None, **kwargs: Any
+    ) -> Dict[str, Any]:
+        """
+        Builds the request the same way the Ollama model does
+        """
+        if self.stop is not None and stop is not None:
+            raise ValueError("`stop` found in both the input and default params.")
+        elif self.stop is not None:
+            stop = self.stop
+        elif stop is None:
+            stop = []
+
+        params = self._default_params
+        for key in self._default_params:
+            if key in kwargs:
+                params[key] = kwargs[key]
+
+        if "options" in kwargs:
+            params["options"] = kwargs["options"]
+        else:
+            params["options"] = {
+                **params["options"],
+                "stop": stop,
+                **{k: v for k, v in kwargs.items() if k not in self._default_params},
+            }
+
+        if self.keep_alive is not None:
+            params["keep_alive"] = self.keep_alive
+
+        if payload.get("messages"):
+            return {"messages": payload.get("messages", []), **params}
+        return {
+            "prompt": payload.get("prompt"),
+            "images": payload.get("images", []),
+            **params,
+        }
+
+    def _raise_for_status(self, status: int, error: str | None):
+        if status == 404:
+            raise OllamaEndpointNotFoundError(
+                "Ollama call failed with status code 404. "
+                "Maybe your model is not found "
+                f"and you should pull the model with `ollama pull {self.model}`."
+            )
+        raise ValueError(
+            f"Ollama call failed with status code {status}. Details: {error}"
+        )
+
+    def keep_loaded(self, keep_alive: Union[int, str]):
+        """
+        Loads the model without generating anything and keeps it loaded for keep_alive, 0 unloads it right away
+        """
+        response = (
+            self._get_pool()
+            .session()
+            .post(
+                url=f"{self.base_url}/api/generate",
+                json={"model": self.model, "keep_alive": keep_alive},
+                timeout=self.timeout,
+            )
+        )
+        if response.status_code != 200:
+            self._raise_for_status(response.status_code, response.json().get("error"))
+
+    def _create_stream(
+        self,
+        api_url: str,
+        payload: Any,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> Iterator[str]:
+        response = (
+            self._get_pool()
+            .session()
+            .post(
+                url=api_url,
+                headers={
+                    "Content-Type": "application/json",
+                    **(self.headers if isinstance(self.headers, dict) else {}),
+                },
+                json=self._request_payload(payload, stop, **kwargs),
+                stream=True,
+                timeout=self.timeout,
+            )
+        )
+        response.encoding = "utf-8"
+        if response.status_code != 200:
+            self._raise_for_status(response.status_code, response.json().get("error"))
+
+        try:
+            yield from response.iter_lines(decode_unicode=True)
+        finally:
+            # A response that wasn't read to the end can't go back into the pool, closing it also stops the generation
+            response.close()
+
+    async def _acreate_stream(
+        self,
+        api_url: str,
+        payload: Any,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        session = self._get_pool().async_session()
+        async with session.post(
+            url=api_url,
+            headers={
+                "Content-Type": "application/json",
+                **(self.headers if isinstance(self.headers, dict) else {}),
+            },
+            json=self._request_payload(payload, stop, **kwargs),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        ) as response:
+            if response.status != 200:
+                error = (await response.json(content_type=None) or {}).get("error")
+                self._raise_for_status(response.status, error)
+
+            try:
+                async for line in response.content:
+                    line = line.decode("utf-8").strip()
+                    if line:
+                        yield line
+            finally:
+                if not response.content.at_eof():
+                    log.debug("Dropping the connection of an unfinished generation")
+                    response.close()
@@ -0,0 +1,241 @@
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from helpers import Packages, TeaTag
+from pydantic import BaseModel
+from streaming import SFC_BLOCK_TAG
+from tokens import count_tokens
+
+# What to keep first when the prompt doesn't fit, lower is kept earlier
+ALWAYS = 0  # The <Tea> tag, the block tags and the imports
+PROPS = 1
+NEAR_TAG = 2
+IMPORTED_PACKAGE = 3
+SCRIPT = 4
+PACKAGE = 5
+TEMPLATE = 6
+DEV_PACKAGE = 7
+STYLE = 8
+
+# How many lines above and below the <Tea> tag count as its surroundings
+NEAR_TAG_LINES = 15
+
+PROP_DEFINITIONS = re.compile(r"\b(defineProps|defineEmits|withDefaults|defineModel)\b")
+IMPORTED_FROM = re.compile(r"""\bfrom\s+['"]([^'"]+)['"]|\bimport\s+['"]([^'"]+)['"]""")
+
+OMITTED_MARKERS = {
+    "script": "// {} omitted",
+    "style": "/* {} omitted */",
+}
+
+
+class PackedContext(BaseModel):
+    parent_file_content: str
+    packages: Dict[str, Dict[str, str]]
+    tokens: int
+    trimmed: List[str]
+
+
+def get_line_blocks(file_content: str) -> Tuple[List[str | None], set[int]]:
+    """
+    Gets the top-level block (script, template or style) every line of the file is in,
+    and the lines that open or close one
+    """
+    blocks: List[str | None] = [None] * (file_content.count("\n") + 1)
+    boundaries = set()
+    open_tag, depth, start = None, 0, 0
+
+    def mark(tag: str, start: int, end: int):
+        first = file_content.count("\n", 0, start)
+        last = file_content.count("\n", 0, end)
+        for line in range(first, last + 1):
+            blocks[line] = tag
+        boundaries.update((first, last))
+
+    for match in SFC_BLOCK_TAG.finditer(file_content):
+        closing, tag = match.group(1) == "/", match.group(2)
+        if open_tag is None:
+            if not closing:
+                open_tag, depth, start = tag, 1, match.start()
+            continue
+        if tag != open_tag or (open_tag != "template" and not closing):
+            continue
+        depth += -1 if closing else 1
+        if depth == 0:
+            mark(open_tag, start, match.end())
+            open_tag = None
+    if open_tag is not None:
+        mark(open_tag, start, len(file_content))
+
+    return blocks, boundaries
+
+
+def _statement_lines(lines: List[str], first: int) -> int:
+    """
+    Gets the line after the statement starting at the given line, following open brackets
+    """
+    depth = 0
+    for index in range(first, len(lines)):
+        line = lines[index]
+        depth += sum(line.count(c) for c in "({[") - sum(line.count(c) for c in ")}]")
+        if depth <= 0:
+            return index + 1
+    return len(lines)
+
+
+def rank_lines(file_content: str, tea_tag: TeaTag) -> List[Tuple[float, str]]:
+    """
+    Ranks every line of the parent file by how much the model needs it, and names what kind of line it is
+    """
+    lines = file_content.split("\n")
+    blocks, boundaries = get_line_blocks(file_content)
+    tag_first = file_content.count("\n", 0, tea_tag.start)
+    tag_last = file_content.count("\n", 0, tea_tag.end)
+
+    ranks: List[Tuple[float, str] | None] = [None] * len(lines)
+    index = 0
+    while index < len(lines):
+        line, block = lines[index], blocks[index]
+        stripped = line.strip()
+        if block == "script" and (
+            stripped.startswith("import ") or PROP_DEFINITIONS.search(stripped)
+        ):
+            rank = ALWAYS if stripped.startswith("import ") else PROPS
+            end = _statement_lines(lines, index)
+            for statement_index in range(index, end):
+                ranks[statement_index] = (rank, "script")
+            index = end
+            continue
+
+        if (
+            tag_first <= index <= tag_last
+            or index in boundaries
+            or (block is None and not stripped)
+        ):
+            ranks[index] = (ALWAYS, block or "template")
+        elif block == "style":
+            ranks[index] = (STYLE, "style")
+        elif block == "script":
+            ranks[index] = (SCRIPT, "script")
+        else:
+            distance = min(abs(index - tag_first), abs(index - tag_last))
+            # Closer lines first, within the same rank
+            rank = NEAR_TAG if distance <= NEAR_TAG_LINES else TEMPLATE
+            ranks[index] = (rank + distance / (len(lines) + 1), block or "template")
+        index += 1
+
+    return ranks
+
+
+def get_imported_packages(file_content: str) -> set[str]:
+    """
+    Gets the package names the file imports from, e.g. vue or @vueuse/core
+    """
+    packages = set()
+    for match in IMPORTED_FROM.finditer(file_content):
+        source = match.group(1) or match.group(2)
+        if source.startswith((".", "/", "~", "#")):
+            continue
+        parts = source.split("/")
+        packages.add("/".join(parts[:2]) if source.startswith("@") else parts[0])
+    return packages
+
+
+def _omitted_marker(line: str, block: str | None, count: int) -> str:
+    indent = line[: len(line) - len(line.lstrip())]
+    marker = OMITTED_MARKERS.get(block, "<!-- {} omitted -->")
+    return indent + marker.format(f"{count} line" if count == 1 else f"{count} lines")
+
+
+def pack_context(
+    file_content: str,
+    tea_tag: TeaTag,
+    packages: Packages,
+    budget: int,
+    model: str,
+) -> PackedContext:
+    """
+    Fits the parent file and the packages into a budget of tokens for the prompt.
+    If they don't fit, the lines and packages the model needs least are left out and reported as trimmed.
+    The <Tea> tag, the block tags and the imports are always kept.
+    """
+    package_groups = packages.model_dump(exclude_none=True)
+    full_tokens = count_tokens(file_content, model) + count_tokens(
+        str(package_groups), model
+    )
+    if full_tokens <= budget:
+        return PackedContext(
+            parent_file_content=file_content,
+            packages=package_groups,
+            tokens=full_tokens,
+            trimmed=[],
+        )
+
+    lines = file_content.split("\n")
+    blocks, _ = get_line_blocks(file_content)
+    # (rank, cost, kind, key), where key is a line number or a (group, package) pair
+    pieces: List[Tuple[float, int, str, int | Tuple[str, str]]] = []
+    for index, (rank, kind) in enumerate(rank_lines(file_content, tea_tag)):
+        pieces.append((rank, count_tokens(lines[index], model) + 1, kind, index))
+
+    imported = get_imported_packages(file_content)
+    for group, versions in package_groups.items():
+        for name, version in versions.items():
+            if group == "devDependencies":
+                rank = DEV_PACKAGE
+            else:
+                rank = IMPORTED_PACKAGE if name in imported else PACKAGE
+            cost = count_tokens(f"'{name}': '{version}', ", model)
+            pieces.append((rank, cost, group, (group, name)))
+
+    # Leave some room for the markers of what was left out
+    remaining = budget - budget // 20
+    kept = set()
+    trimmed = Counter()
+    for rank, cost, kind, key in sorted(pieces, key=lambda piece: piece[0]):
+        if rank == ALWAYS or cost <= remaining:
+            kept.add(key)
+            remaining -= cost
+        else:
+            trimmed[kind] += 1
+
+    packed_lines = []
+    omitted = []
+    for index, line in enumerate(lines + [None]):
+        if line is not None and index not in kept:
+            omitted.append(index)
+            continue
+        # Blank lines are left out without a marker
+        code_lines = [i for i in omitted if lines[i].strip()]
+        if code_lines:
+            first = code_lines[0]
+            packed_lines.append(
+                _omitted_marker(lines[first], blocks[first], len(code_lines))
+            )
+        omitted = []
+        if line is not None:
+            packed_lines.append(line)
+    parent_file_content = "\n".join(packed_lines)
+
+    packed_packages = {
+        group: {
+            name: version for name, version in versions.items() if (group, name) in kept
+        }
+        for group, versions in package_groups.items()
+    }
+
+    return PackedContext(
+        parent_file_content=parent_file_content,
+        packages=packed_packages,
+        tokens=count_tokens(parent_file_content, model)
+        + count_tokens(str(packed_packages), model),
+        trimmed=[
+            (
+                f"{count} {kind}"
+                if kind in package_groups
+                else f"{count} {kind} line{'' if count == 1 else 's'}"
+            )
+            for kind, count in trimmed.items()
+        ],
+    )
@@ -0,0 +1,89 @@
+import re
+from typing import List, Tuple
+
+from sfc import Sfc
+
+# Every block of the script replaces the lines after SEARCH with the lines after the divider.
+# Models sometimes leave out the REPLACE marker, then the block ends where the next one starts or with the response.
+EDIT_BLOCK = re.compile(
+    r"^<{5,}[ \t]*SEARCH[^\n]*\n(.*?)^={5,}[ \t]*\n(.*?)(?:^>{5,}[ \t]*REPLACE[^\n]*$|(?=^<{5,}[ \t]*SEARCH)|\Z)",
+    re.MULTILINE | re.DOTALL,
+)
+
+SearchReplace = Tuple[str, str]
+
+
+def parse_edit_script(response: str) -> List[SearchReplace]:
+    """
+    Gets the search and replace blocks from the code fence of the response.
+    An empty code fence means there is nothing to change.
+    """
+    parts = response.split("```")
+    script = parts[1] if len(parts) > 1 else response
+    edits = [(m.group(1), m.group(2)) for m in EDIT_BLOCK.finditer(script)]
+    # The first line of the fence is its language
+    if not edits and (len(parts) < 2 or script.partition("\n")[2].strip()):
+        raise ValueError("The response has no SEARCH/REPLACE block")
+    return edits
+
+
+def _find_lines(content: str, search: str) -> Tuple[int, int]:
+    """
+    Finds the lines that match the search when leading and trailing whitespace is ignored,
+    models often get the indentation wrong
+    """
+    lines = content.splitlines(keepends=True)
+    wanted = [line.strip() for line in search.strip("\n").split("\n")]
+    stripped = [line.strip() for line in lines]
+    matches = [
+        i
+        for i in range(len(lines) - len(wanted) + 1)
+        if stripped[i : i + len(wanted)] == wanted
+    ]
+    if len(matches) != 1:
+        found = "isn't in" if not matches else "is more than once in"
+        raise ValueError(f"The search {search.strip()!r} {found} the component")
+    start = sum(len(line) for line in lines[: matches[0]])
+    end = start + sum(
+        len(line) for line in lines[matches[0] : matches[0] + len(wanted)]
+    )
+    return start, end
+
+
+def apply_edit_script(content: str, edits: List[SearchReplace]) -> str:
+    """
+    Applies the blocks in order, each has to match exactly one place in the component.
+    Raises a ValueError when a block doesn't apply or the component breaks, the whole script is dropped then.
+    """
+    for search, replace in edits:
+        if not search.strip():
+            raise ValueError("A SEARCH block is empty")
+        # The blocks hold whole lines, so matches inside a line don't count
+        starts = [
+            m.start()
+            for m in re.finditer(re.escape(search), content)
+            if m.start() == 0 or content[m.start() - 1] == "\n"
+        ]
+        if len(starts) == 1:
+            start, end = starts[0], starts[0] + len(search)
+        elif starts:
+            raise ValueError(
+                f"The search {search.strip()!r} is more than once in the component"
+            )
+        else:
+            start, end = _find_lines(content, search)
+            if (
+                replace
+                and content[start:end].endswith("\n")
+                and not replace.endswith("\n")
+            ):
+                replace += "\n"
+        content = content[:start] + replace + content[end:]
+
+    blocks = Sfc(content).blocks
+    if not any(block.tag == "template" for block in blocks):
+        raise ValueError("The edited component has no template")
+    unclosed = [block.tag for block in blocks if block.end == block.content_end]
+    if unclosed:
+        raise ValueError(f"The edited component doesn't close its {unclosed[0]}")
+    return content
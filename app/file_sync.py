@@ -0,0 +1,50 @@
+import os
+import tempfile
+
+from helpers import log
+
+# Reading the umask means setting it, which is only safe before any worker thread runs
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def write_atomic(path: str, content: str):
+    """
+    Writes through a temp file next to the file that is renamed over it,
+    so that a reader like the Vite dev server never sees a half written file
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", prefix=".tea-", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(content)
+        # mkstemp only lets the owner read the file, keep the permissions a normal write would leave
+        try:
+            mode = os.stat(path).st_mode
+        except FileNotFoundError:
+            mode = 0o666 & ~UMASK
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def sync_file(path: str, content: str) -> bool:
+    """
+    Writes the file unless it already holds the content, returns whether it was written.
+    Every write makes the dev server reload the file, so rewriting identical content only causes reloads.
+    """
+    try:
+        with open(path, "r") as file:
+            if file.read() == content:
+                log.debug(f"{path} is unchanged")
+                return False
+    except FileNotFoundError:
+        pass
+    write_atomic(path, content)
+    return True
@@ -0,0 +1,90 @@
+import hashlib
+from threading import Lock
+from typing import Dict, List
+
+from file_sync import sync_file
+from generations import tag_fingerprint
+from helpers import TeaTag, get_steep_id
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class FingerprintIndex:
+    """
+    Remembers the content Tea last wrote to each file and the <Tea> tags it last processed for each file,
+    so that the watcher events of our own writes and saves that don't touch a tag can be dropped,
+    and a save only steeps the tags it changed.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._written: Dict[str, str] = {}
+        # The fingerprint of every tag of a file, by steep id
+        self._tags: Dict[str, Dict[str, str]] = {}
+
+    def write_file(self, path: str, content: str) -> bool:
+        """
+        Writes a watched file unless it already holds the content and remembers it as our own write.
+        Returns whether it was written.
+        """
+        written_hash = content_hash(content)
+        with self._lock:
+            self._written[path] = written_hash
+        written = sync_file(path, content)
+        # An unchanged file raises no event to swallow
+        if not written:
+            with self._lock:
+                if self._written.get(path, None) == written_hash:
+                    del self._written[path]
+        return written
+
+    def is_own_write(self, path: str, content: str) -> bool:
+        """
+        Whether the content on disk is exactly what Tea last wrote to the file.
+        Only the first event of a write is swallowed, a later save of the same content is the user's.
+        """
+        with self._lock:
+            if self._written.get(path, None) != content_hash(content):
+                return False
+            del self._written[path]
+            return True
+
+    def tags_changed(self, path: str, tea_tags: List[TeaTag]) -> bool:
+        """
+        Whether a tag of the file was added, removed or changed since the tags were recorded
+        """
+        fingerprints = self._tags_fingerprints(tea_tags)
+        # Tags without a valid steep id or with the same one are stamped with a new id
+        if None in fingerprints or len(fingerprints) != len(tea_tags):
+            return True
+        with self._lock:
+            return self._tags.get(path, None) != fingerprints
+
+    def changed_tags(self, path: str, tea_tags: List[TeaTag]) -> List[TeaTag]:
+        """
+        The tags that are new or changed since they were recorded, by steep id
+        """
+        with self._lock:
+            recorded = dict(self._tags.get(path, {}))
+        return [
+            tea_tag
+            for tea_tag in tea_tags
+            if recorded.get(get_steep_id(tea_tag), None) != tag_fingerprint(tea_tag)
+        ]
+
+    def record_tags(self, path: str, tea_tags: List[TeaTag]):
+        with self._lock:
+            self._tags[path] = self._tags_fingerprints(tea_tags)
+
+    def forget_tag(self, path: str, steep_id: str):
+        """
+        Makes the next save of the file go through for the tag, e.g. after a failed generation
+        """
+        with self._lock:
+            self._tags.get(path, {}).pop(steep_id, None)
+
+    @staticmethod
+    def _tags_fingerprints(tea_tags: List[TeaTag]) -> Dict[str | None, str]:
+        return {get_steep_id(tea_tag): tag_fingerprint(tea_tag) for tea_tag in tea_tags}
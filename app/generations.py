@@ -0,0 +1,108 @@
+from threading import Event, Lock
+from typing import Dict, Iterable, Tuple
+
+from helpers import TeaTag, log
+
+GenerationKey = Tuple[str, str]
+
+
+class GenerationCancelled(Exception):
+    """
+    Raised inside a generation once a newer save of its tag has superseded it
+    """
+
+
+class Generation:
+    """
+    A version token for one generation of a <Tea> tag
+    """
+
+    def __init__(self, key: GenerationKey, fingerprint: str, version: int):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.version = version
+        self._cancelled = Event()
+        self.finished = False
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check(self):
+        """
+        Raises if the generation has been superseded
+        """
+        if self.cancelled:
+            raise GenerationCancelled(
+                f"Generation {self.version} of {self.key} was superseded"
+            )
+
+
+def tag_fingerprint(tea_tag: TeaTag) -> str:
+    """
+    Identifies what a tag asks for, so that a save which doesn't change it isn't a new version
+    """
+    props = ",".join(f"{k}={v}" for k, v in sorted(tea_tag.props.items()))
+    children = " ".join(tea_tag.children.split())
+    return f"{props}\n{children}"
+
+
+class GenerationRegistry:
+    """
+    Keeps track of the latest generation of every <Tea> tag, keyed by file and steep id.
+    Starting a newer version of a tag cancels the one still in flight.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._current: Dict[GenerationKey, Generation] = {}
+        self._versions: Dict[GenerationKey, int] = {}
+
+    def begin(self, key: GenerationKey, fingerprint: str) -> Generation | None:
+        """
+        Starts a new version of a tag, or returns None when the same version is still generating
+        """
+        with self._lock:
+            current = self._current.get(key, None)
+            if current and not current.finished and not current.cancelled:
+                if current.fingerprint == fingerprint:
+                    return None
+                log.info(f"Cancelling superseded generation of {key}")
+                current.cancel()
+
+            version = self._versions.get(key, 0) + 1
+            self._versions[key] = version
+            generation = Generation(key, fingerprint, version)
+            self._current[key] = generation
+            return generation
+
+    def finish(self, generation: Generation) -> bool:
+        """
+        Marks a generation as finished, returns whether it was still the latest one of its tag
+        """
+        with self._lock:
+            generation.finished = True
+            if self._current.get(generation.key, None) is generation:
+                del self._current[generation.key]
+                return not generation.cancelled
+            return False
+
+    def cancel(self, key: GenerationKey):
+        with self._lock:
+            current = self._current.pop(key, None)
+            if current:
+                log.info(f"Cancelling generation of {key}")
+                current.cancel()
+
+    def cancel_file(self, file_path: str, keep: Iterable[GenerationKey] = ()):
+        """
+        Cancels the generations of a file whose tags are gone
+        """
+        keep = set(keep)
+        with self._lock:
+            keys = [k for k in self._current if k[0] == file_path and k not in keep]
+        for key in keys:
+            self.cancel(key)
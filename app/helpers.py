@@ -1,6 +1,8 @@
 import logging
 import os
 import re
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Any, Dict, List
 
@@ -12,6 +14,28 @@ log_level = os.getenv("LOG_LEVEL", "INFO")
 logging.basicConfig(filename=file_log, level=getattr(logging, log_level.upper()))
 log = logging.getLogger("Tea")
 
+# How long the slow imports took, they are only done once they are needed
+import_times: Dict[str, float] = {}
+
+
+@contextmanager
+def timed_import(name: str):
+    """
+    Times the imports in the block towards the startup breakdown
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        import_times[name] = import_times.get(name, 0) + time.perf_counter() - started
+
+
+def log_import_times():
+    log.info(
+        "Imports took "
+        + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in import_times.items())
+    )
+
 
 class Packages(BaseModel):
     dependencies: Dict[str, str] | None
@@ -27,14 +51,15 @@ class FileContext(BaseModel):
 
 
 class TeaTag(BaseModel):
-    match: re.Match[str]
     tag: str
     props: dict
     children: str
     attributes: str
-
-    class Config:
-        arbitrary_types_allowed = True
+    # Offsets in the file of the whole tag and of the attributes of its opening tag
+    start: int
+    end: int
+    attributes_start: int
+    attributes_end: int
 
 
 class SteepContext(FileContext):
@@ -54,9 +79,41 @@ class EnvConfig(BaseModel):
     base_url: str
     log_level: str
     openai_key: str | None
+    workers: int
+    llm_concurrency: int
+    cache_directory: str
+    cache_max_mb: int
+    prompt_token_budget: int
+    metrics_directory: str
+    async_llm: bool
+    keep_alive_minutes: int
+    idle_minutes: int
+    refine_steeps: bool
+    related_components: int
+
+
+# Every <Tea> tag in a file is stamped with an id, which picks its steep file in the file's cup
+STEEP_ID_PROP = "steep"
+# Ids end up in file names and imports, so anything but a number is stamped over
+STEEP_ID = re.compile(r"^\d+$")
+
+
+def get_steep_id(tea_tag: TeaTag) -> str | None:
+    """
+    The steep id of a tag, or None when it has none or one that isn't a number
+    """
+    steep_id = tea_tag.props.get(STEEP_ID_PROP, None)
+    if isinstance(steep_id, str) and STEEP_ID.match(steep_id):
+        return steep_id
+    return None
 
 
-tea_import_statement = "import Tea from './cup/Tea.vue'"
+# The files Tea generates in the cup of a file, whether the file is at the root or in a folder below it
+CUP_PATTERNS = [
+    f"{folder}cup/*/{name}"
+    for folder in ("", "*/")
+    for name in ("Steep*.*", "Tea.*", "Heating.*")
+]
 
 CONFIG_DEFAULTS = {
     "MODEL": "deepseek-coder:6.7b-instruct",
@@ -64,108 +121,37 @@ CONFIG_DEFAULTS = {
     "ROOT_DIRECTORY": None,
     "TEMPERATURE": "0.5",
     "PATTERNS": "*.vue",
-    "IGNORE_PATTERNS": "Tea.vue,Steep.vue,Heating.vue",
+    "IGNORE_PATTERNS": ",".join(CUP_PATTERNS),
+    "WORKERS": "4",
+    # How many generations can run at once on each backend
+    "OLLAMA_CONCURRENCY": "2",
+    "OPENAI_CONCURRENCY": "8",
+    "CACHE_DIRECTORY": "~/.cache/tea",
+    "CACHE_MAX_MB": "100",
+    "PROMPT_TOKEN_BUDGET": "6000",
+    "METRICS_DIRECTORY": "~/.cache/tea/metrics",
+    "ASYNC_LLM": "true",
+    "KEEP_ALIVE_MINUTES": "10",
+    "IDLE_MINUTES": "30",
+    "REFINE_STEEPS": "true",
+    "RELATED_COMPONENTS": "5",
 }
 
 
-def extract_tag(file_content, tag="\w+", attribute=""):
+def get_teacup_folder(file_path: str) -> str:
     """
-    Extracts a tag from the file content based on the tag name and additional attributes.
+    Gets the folder holding the steeps of a file, each file in a folder gets its own
     """
-    pattern = rf"<({tag})\s?([^>/]*?{attribute}[^>/]*)(?:>(.*?)</{tag}>|/>)"
-    match = re.search(pattern, file_content, re.DOTALL)
-
-    if match:
-        tag_name, attributes, content = match.groups()
-        props = {
-            m[0]: m[1] or True
-            for m in re.findall(r'(\w+)(?:=["\']([^"\']+)["\']|\b)', attributes)
-        }
-        return TeaTag(
-            match=match,
-            tag=tag_name,
-            props=props,
-            children=content.strip() if content else "",
-            attributes=attributes,
-        )
-
-    return None
+    path_to_file_folder, file_name = os.path.split(file_path)
+    return os.path.join(path_to_file_folder, "cup", file_name.rsplit(".", 1)[0])
 
 
-def pour_tag(file_content: str, new_component_name: str):
+def get_tea_import_statement(file_path: str) -> str:
     """
-    Replaces a tag with the newly created component
+    Gets the statement importing the Tea component of a file from its cup
     """
-    script_pattern = r"(<Tea)([^>]*)>([\s\S]*?)(<\/Tea>)"
-    match = re.search(script_pattern, file_content)
-    if match:
-        tag, attributes, content, end_tag = match.groups()
-        # Remove the pour attribute
-        new_attributes = re.sub(
-            rf"pour=[\"']{new_component_name}[\"']", "", attributes
-        ).rstrip()
-
-        return re.sub(
-            script_pattern,
-            f"<{new_component_name}{new_attributes}></{new_component_name}>",
-            file_content,
-        )
-    else:
-        # No script tag found, return original file content
-        return file_content
-
-
-def set_import(
-    file_content: str, import_statement: str, remove=False
-) -> tuple[str, bool]:
-    # Pattern to match the script tag and any content inside it
-    script_pattern = r"(<script[^>]*>)([\s\S]*?)(<\/script>)"
-    # Pattern to match import statements
-    import_pattern = r"(import .*?;)"
-
-    def add_import(script_content: str) -> str:
-        # Check if the import statement already exists
-        if import_statement in script_content:
-            return script_content  # No change needed
-
-        # Check for existing import statements
-        existing_imports = re.findall(import_pattern, script_content)
-        if existing_imports:
-            # Add the new import after the last existing import
-            last_import = existing_imports[-1]
-            return script_content.replace(
-                last_import, last_import + "\n" + import_statement
-            )
-        else:
-            # No existing imports, add after <script> tag
-            return "\n" + import_statement + "\n" + script_content
-
-    def remove_import(script_content: str) -> str:
-        # Remove the specified import statement
-        return re.sub(rf"{import_statement}\s*\n?", "", script_content)
-
-    # Find the script tag content
-    match = re.search(script_pattern, file_content)
-    if match:
-        script_tag, script_content, script_end_tag = match.groups()
-        new_script_content = (
-            remove_import(script_content) if remove else add_import(script_content)
-        )
-        # Replace old script content with new script content
-        return (
-            file_content.replace(
-                script_tag + script_content + script_end_tag,
-                script_tag + new_script_content + script_end_tag,
-            ),
-            True,
-        )
-    else:
-        # If no script tag is found, add one with the import if it's not being removed
-        return (
-            (file_content, False)
-            if remove
-            else (f"\n<script setup>\n{import_statement}\n</T>\n{file_content}", True)
-        )
+    teacup_folder = os.path.basename(get_teacup_folder(file_path))
+    return f"import Tea from './cup/{teacup_folder}/Tea.vue'"
 
 
 def get_packages(root_directory: str) -> Packages:
@@ -180,16 +166,21 @@ def get_packages(root_directory: str) -> Packages:
         )
 
 
-def get_ts_configs(root_directory: str, file_name: str) -> Dict[str, Any]:
+def get_ts_configs(
+    root_directory: str, file_name: str, read_files: List[str] = None
+) -> Dict[str, Any]:
     """
-    Gets the ts configs from the tsconfig.json file
+    Gets the ts configs from the tsconfig.json file.
+    Every file in the extends chain is added to read_files if it is given.
     """
     ts_config_path = Path(root_directory, file_name)
+    if read_files is not None:
+        read_files.append(str(ts_config_path))
     with open(ts_config_path, "r") as tsconfig_file:
         tsconfig_json: Dict = json5.loads(tsconfig_file.read())
         if "extends" in tsconfig_json:
             extended_path = str(Path(root_directory, tsconfig_json["extends"]))
-            extended = get_ts_configs(extended_path, "")
+            extended = get_ts_configs(extended_path, "", read_files)
             del tsconfig_json["extends"]
             # Merge two configs, overwriting the second one
             extended.update(tsconfig_json)
@@ -198,19 +189,59 @@ def get_ts_configs(root_directory: str, file_name: str) -> Dict[str, Any]:
             return tsconfig_json
 
 
-def get_paths_from_tsconfig(root_directory: str) -> Dict[str, List[str]]:
+def get_paths_from_tsconfig(
+    root_directory: str, read_files: List[str] = None
+) -> Dict[str, List[str]]:
     """
     Gets the paths from the tsconfig.json file
     """
-    tsconfig_json = get_ts_configs(root_directory, "tsconfig.json")
+    tsconfig_json = get_ts_configs(root_directory, "tsconfig.json", read_files)
     if "paths" in tsconfig_json.get("compilerOptions", None):
         return tsconfig_json["compilerOptions"]["paths"]
     else:
         return {}
 
 
-def get_available_components(root_directory: str):
-    is_nuxt = ".nuxt" in os.listdir(root_directory)
+def get_path_aliases(
+    root_directory: str, read_files: List[str] = None
+) -> Dict[str, str]:
+    """
+    Gets the directory every wildcard path alias of the tsconfig.json file points to,
+    e.g. {"@/": "/project/src"} for "@/*": ["./src/*"].
+    Every file in the extends chain is added to read_files if it is given.
+    """
+    config_path = Path(root_directory, "tsconfig.json")
+    paths = paths_directory = base_url = None
+    while config_path:
+        if read_files is not None:
+            read_files.append(str(config_path))
+        with open(config_path, "r") as tsconfig_file:
+            tsconfig_json: Dict = json5.loads(tsconfig_file.read())
+        compiler_options = tsconfig_json.get("compilerOptions", {})
+        # The closest config wins, and its paths are relative to the baseUrl or to the config itself
+        if paths is None and "paths" in compiler_options:
+            paths, paths_directory = compiler_options["paths"], config_path.parent
+        if base_url is None and "baseUrl" in compiler_options:
+            base_url = config_path.parent / compiler_options["baseUrl"]
+
+        extends = tsconfig_json.get("extends", None)
+        config_path = Path(config_path.parent, extends) if extends else None
+        # e.g. a config extended from a package, which has no aliases of the project
+        if config_path and not config_path.is_file():
+            config_path = None
+
+    aliases = {}
+    for alias, targets in (paths or {}).items():
+        if alias.endswith("/*") and targets and targets[0].endswith("/*"):
+            directory = Path(base_url or paths_directory, targets[0][:-2])
+            aliases[alias[:-1]] = os.path.normpath(directory)
+    return aliases
+
+
+def get_available_components(root_directory: str, root_files: List[str] = None):
+    is_nuxt = ".nuxt" in (
+        root_files if root_files is not None else os.listdir(root_directory)
+    )
 
     if is_nuxt:
         nuxt_components = Path(root_directory, ".nuxt/components.d.ts")
@@ -218,15 +249,13 @@ def get_available_components(root_directory: str):
         if nuxt_components.exists():
             with open(nuxt_components, "r") as nuxt_components_file:
                 file_content = nuxt_components_file.read()
-                matches: List[str] = re.findall(reg, file_content)
+                matches: List[str] = []
+                for match in re.finditer(reg, file_content):
+                    # Stop at the first lazy component, the rest are all generated automatically and don't need to take up context
+                    if match.group(1).startswith("Lazy"):
+                        break
+                    matches.append(match.group(1))
                 if matches:
-                    # Iterate through matches until we find the first lazy component
-                    first_lazy_index = next(
-                        (i for i, x in enumerate(matches) if x.startswith("Lazy")), None
-                    )
-
-                    # remove from the first lazy component onwards, since those are all generated automatically and don't need to take up context
-                    matches = matches[:first_lazy_index]
                     return f"""
 This is a Nuxt.js project. COMPONENTS ARE AUTOMATICALLY IMPORTED. DO NOT INCLUDE AN IMPORT STATEMENT WHEN USING THESE COMPONENTS! You have the following components globally available for you. DO NOT IMPORT THESE COMPONENTS:
                     ```
@@ -0,0 +1,49 @@
+from collections import OrderedDict
+from threading import Condition
+
+
+class JobQueue:
+    """
+    A thread-safe queue of files waiting to be processed, keyed by path.
+
+    Saving the same file several times before a worker picks it up only results in one job,
+    and a path that is currently being processed is not handed out again until it is done.
+    """
+
+    def __init__(self):
+        self._pending: OrderedDict[str, None] = OrderedDict()
+        self._active: set[str] = set()
+        self._condition = Condition()
+
+    def put(self, path: str):
+        """
+        Queues a path, merging it with a pending job for the same path if there is one
+        """
+        with self._condition:
+            self._pending[path] = None
+            self._condition.notify()
+
+    def get(self) -> str:
+        """
+        Blocks until a path is ready to be processed and marks it as active
+        """
+        with self._condition:
+            while True:
+                path = next((p for p in self._pending if p not in self._active), None)
+                if path is not None:
+                    del self._pending[path]
+                    self._active.add(path)
+                    return path
+                self._condition.wait()
+
+    def done(self, path: str):
+        """
+        Marks an active path as processed so that it can be handed out again
+        """
+        with self._condition:
+            self._active.discard(path)
+            self._condition.notify_all()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pending)
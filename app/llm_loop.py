@@ -0,0 +1,40 @@
+import asyncio
+from concurrent.futures import Future
+from threading import Thread
+from typing import Any, Coroutine
+
+
+class LLMLoop:
+    """
+    Runs every generation on one asyncio event loop in its own thread.
+    A generation waiting on the model only holds a coroutine, not a thread, so many can stream at once,
+    and the slots limit how many of them are sent to the backend at the same time.
+    """
+
+    def __init__(self, concurrency: int):
+        self.loop = asyncio.new_event_loop()
+        self.slots = asyncio.Semaphore(concurrency)
+        self.thread = Thread(target=self._run, name="tea-llm", daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, coroutine: Coroutine) -> Future:
+        """
+        Schedules the coroutine on the loop from any thread
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine: Coroutine) -> Any:
+        """
+        Runs the coroutine on the loop and blocks the calling thread until it is done
+        """
+        return self.submit(coroutine).result()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
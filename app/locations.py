@@ -0,0 +1,98 @@
+import os
+import re
+from typing import Dict
+
+from helpers import log
+from project_index import ProjectIndex
+
+COMPONENTS_DIRECTORY = "components"
+NUXT_CONFIGS = ["nuxt.config.ts", "nuxt.config.js", "nuxt.config.mjs"]
+
+
+def find_components_directory(parent_path: str, root_directory: str) -> str | None:
+    """
+    Finds the components directory closest to the parent component, from its folder up to the root
+    """
+    root_directory = os.path.abspath(root_directory)
+    directory = os.path.dirname(os.path.abspath(parent_path))
+    while True:
+        candidate = os.path.join(directory, COMPONENTS_DIRECTORY)
+        if os.path.isdir(candidate):
+            return candidate
+        if directory == root_directory or not directory.startswith(root_directory):
+            return None
+        directory = os.path.dirname(directory)
+
+
+def get_import_path(
+    component_path: str, parent_path: str, aliases: Dict[str, str]
+) -> str:
+    """
+    Imports the component through the alias pointing closest to it, or relative to the parent without one
+    """
+    covering = [
+        (alias, directory)
+        for alias, directory in aliases.items()
+        if component_path.startswith(directory + os.sep)
+    ]
+    if covering:
+        # The longest directory leaves the shortest import, the first alias wins a tie
+        alias, directory = max(covering, key=lambda item: len(item[1]))
+        relative_path = os.path.relpath(component_path, directory)
+        return alias + relative_path.replace(os.sep, "/")
+
+    relative_path = os.path.relpath(component_path, os.path.dirname(parent_path))
+    relative_path = relative_path.replace(os.sep, "/")
+    return relative_path if relative_path.startswith("../") else "./" + relative_path
+
+
+def get_nuxt_component_name(component_path: str) -> str:
+    """
+    The name Nuxt imports a component by: its folders below components/ and its file name,
+    without repeating a prefix the file name already has, e.g. components/base/BaseButton.vue is BaseButton
+    """
+    parts = os.path.normpath(component_path).split(os.sep)
+    if COMPONENTS_DIRECTORY in parts[:-1]:
+        index = len(parts) - 1 - parts[:-1][::-1].index(COMPONENTS_DIRECTORY)
+        parts = parts[index:]
+    else:
+        parts = parts[-1:]
+    parts[-1] = os.path.splitext(parts[-1])[0]
+
+    name = ""
+    for part in parts:
+        part = "".join(word[:1].upper() + word[1:] for word in re.split(r"[-_]", part))
+        name = part if part.startswith(name) else name + part
+    return name
+
+
+def resolve_component_location(
+    component_name: str, parent_path: str, project_index: ProjectIndex
+) -> Dict[str, str] | None:
+    """
+    Picks where a poured component goes without asking the model, in the same shape as its answer.
+    Returns None when there is no obvious place, so that the model decides.
+    """
+    root_directory = project_index.root_directory
+    components_directory = find_components_directory(parent_path, root_directory)
+    if components_directory is None:
+        log.debug(f"No components directory above {parent_path}")
+        return None
+
+    logical_path = os.path.join(components_directory, f"{component_name}.vue")
+    # Don't overwrite a component that is already there
+    if os.path.exists(logical_path):
+        log.debug(f"{logical_path} already exists")
+        return None
+
+    aliases = project_index.path_aliases()
+    # Nuxt aliases the root even before .nuxt/tsconfig.json is generated
+    if not aliases and any(f in project_index.root_files() for f in NUXT_CONFIGS):
+        aliases = {"~/": root_directory}
+
+    return {
+        "logical_path": logical_path,
+        "import_statement_from_root": get_import_path(
+            logical_path, os.path.abspath(parent_path), aliases
+        ),
+    }
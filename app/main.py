@@ -1,77 +1,222 @@
 import os
 import shutil
-import time
-from typing import Union
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Thread
+from typing import TYPE_CHECKING, Callable, List, Union
 
-from agent import TeaAgent
+from cache import GenerationCache
+from component_creation import (
+    create_loading_component,
+    create_steep_component,
+    create_tea_component,
+    is_steeped,
+)
+from component_index import ComponentIndex
+from file_sync import sync_file
+from fingerprints import FingerprintIndex
+from generations import Generation, GenerationRegistry, tag_fingerprint
 from helpers import (
     CONFIG_DEFAULTS,
+    STEEP_ID_PROP,
     EnvConfig,
     FileContext,
     SteepContext,
     TeaTag,
-    extract_tag,
-    get_packages,
+    get_steep_id,
+    get_tea_import_statement,
+    get_teacup_folder,
     log,
-    set_import,
-    tea_import_statement,
+    log_import_times,
+    timed_import,
 )
-from langchain_community.llms.ollama import Ollama
-from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.language_models.llms import BaseLLM
-from langchain_openai import ChatOpenAI
+from jobs import JobQueue
+from llm_loop import LLMLoop
+from metrics import MetricsRecorder
+from model_keeper import ModelKeeper
+from project_index import ProjectIndex
+from scheduler import Scheduler
+from sfc import Sfc, steep_id_edits
+from tag_index import TagIndex
 from watcher import FileWatcher
 
+# The LLM backends take seconds to import, they are only imported once the watcher is running
+if TYPE_CHECKING:
+    from agent import TeaAgent
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.language_models.llms import BaseLLM
+
 watcher: FileWatcher = None
 
 
 class Main:
-    def __init__(self, llm: Union[BaseLLM, BaseChatModel], config: EnvConfig):
-        if llm:
+    def __init__(
+        self,
+        llm: Union["BaseLLM", "BaseChatModel"],
+        config: EnvConfig,
+        load_llm: Callable[[], Union["BaseLLM", "BaseChatModel"]] = None,
+    ):
+        """
+        Takes the LLM, or a function creating it that is called once the watcher is running
+        """
+        if llm or load_llm:
             self.llm = llm
+            self.load_llm = load_llm
         else:
             raise Exception("LLM not provided")
 
-        self.tea_agent = TeaAgent(llm=llm)
+        self.llm_slots = BoundedSemaphore(config.llm_concurrency)
+        # Generations stream on one event loop, or each on its own thread without it
+        self.llm_loop = LLMLoop(config.llm_concurrency) if config.async_llm else None
+        if self.llm_loop:
+            self.llm_loop.start()
+        self.cache = (
+            GenerationCache(
+                directory=config.cache_directory,
+                max_bytes=config.cache_max_mb * 1024 * 1024,
+            )
+            if config.cache_max_mb > 0
+            else None
+        )
+        self.generations = GenerationRegistry()
+        self.fingerprints = FingerprintIndex()
+        self.tag_index = TagIndex()
+        self.component_index = ComponentIndex()
+        # Steeps run here so a newer save of the file can be handled (and supersede them) while they stream
+        self.steep_pool = (
+            None
+            if self.llm_loop
+            else ThreadPoolExecutor(
+                max_workers=config.llm_concurrency, thread_name_prefix="tea-steep"
+            )
+        )
         self.patterns = config.patterns
         self.root_directory = config.root_directory
         self.ignore_patterns = config.ignore_patterns
+        self.project_index = ProjectIndex(config.root_directory)
+        self.prompt_token_budget = config.prompt_token_budget
+        self.refine_steeps = config.refine_steeps
+        self.related_components = config.related_components
+        self.metrics = (
+            MetricsRecorder(config.metrics_directory)
+            if config.metrics_directory
+            else None
+        )
+        self.keep_alive_minutes = config.keep_alive_minutes
+        self.idle_minutes = config.idle_minutes
+        self.model_keeper: ModelKeeper = None
+        self.workers = config.workers
+        self.jobs = JobQueue()
+        self.scheduler = Scheduler(
+            jobs=self.jobs,
+            handler=lambda file_path: self.process_file(
+                file_path, root_directory=self.root_directory
+            ),
+            max_workers=config.workers,
+        )
 
     def run(self):
         log.info("Starting...")
 
         watcher = FileWatcher(
             root_directory=self.root_directory,
+            jobs=self.jobs,
             watch_patterns=self.patterns,
             ignore_patterns=self.ignore_patterns,
+            project_index=self.project_index,
+            tag_index=self.tag_index,
+            component_index=self.component_index,
         )
         watcher.start()
-        prev_inc = 0
+
+        # Saves made in the meantime wait in the job queue
+        watched_files = list(watcher.watched_files())
+        self.tag_index.scan(watched_files, max_workers=self.workers)
+        if self.related_components:
+            # Only the prompts need the components, steeping can start before they are all read
+            Thread(
+                target=self.component_index.scan,
+                args=(watched_files, self.workers),
+                name="tea-components",
+                daemon=True,
+            ).start()
+        self.load()
+        # The model is only kept loaded once load() knows which one it is
+        watcher.model_keeper = self.model_keeper
+        self.resume()
+        self.scheduler.start()
 
         try:
-            while True:
-                time.sleep(1)
-                if prev_inc != watcher.last_modified_file_inc:
-                    log.info(f"File changed: {watcher.last_modified_file}")
-
-                    self.process_file(
-                        watcher.last_modified_file,
-                        root_directory=self.root_directory,
-                    )
-                    time.sleep(1)
-                    prev_inc = watcher.last_modified_file_inc
+            self.scheduler.join()
         except KeyboardInterrupt:
             log.warning("Stopping...")
             watcher.stop()
             exit()
 
-    def process_tea_tag(self, tea_tag: TeaTag, ctx: FileContext = None):
+    def load(self):
         """
-        Steeps (WIP version) or Pours (finalizes) <Tea> components.
+        Does the slow imports and creates the LLM
+        """
+        with timed_import("agent"):
+            import agent  # noqa: F401
+        if not self.llm:
+            self.llm = self.load_llm()
+        log_import_times()
+
+        # Only Ollama loads the model on our machine, load it now instead of on the first steep
+        if hasattr(self.llm, "keep_loaded") and self.keep_alive_minutes > 0:
+            self.model_keeper = ModelKeeper(
+                llm=self.llm,
+                keep_alive_minutes=self.keep_alive_minutes,
+                idle_minutes=self.idle_minutes,
+            )
+            self.model_keeper.start()
+
+    def resume(self):
+        """
+        Queues the files with tags that were left unfinished when Tea stopped,
+        the tags of the other files count as processed until they change
+        """
+        for file_path in self.tag_index.files_with_tags():
+            tea_tags = self.tag_index.tags(file_path)
+            finished = [t for t in tea_tags if not self.is_unfinished(file_path, t)]
+            # Only the unfinished tags count as changed, so they are the only ones steeped again
+            self.fingerprints.record_tags(file_path, finished)
+            if len(finished) < len(tea_tags):
+                log.info(f"Resuming the <Tea> tags of {file_path}")
+                self.jobs.put(file_path)
+            if self.model_keeper:
+                self.model_keeper.tags_seen(file_path, has_tags=True)
+
+    def is_unfinished(self, file_path: str, tea_tag: TeaTag) -> bool:
+        """
+        Whether a tag still has to be poured, or was never steeped to the end, e.g. Tea stopped while it streamed
+        """
+        steep_id = get_steep_id(tea_tag)
+        if tea_tag.props.get("pour", None) or steep_id is None:
+            return True
+        extension = file_path.split(".")[-1]
+        steep_path = os.path.join(
+            get_teacup_folder(file_path), f"Steep{steep_id}." + extension
+        )
+        try:
+            with open(steep_path, "r") as steep_file:
+                return not is_steeped(steep_file.read())
+        except FileNotFoundError:
+            return True
+
+    def make_steep_context(self, tea_tag: TeaTag, ctx: FileContext) -> SteepContext:
+        """
+        Gives a <Tea> tag its own steep file in the cup of its file.
         """
         extension = ctx.file_path.split(".")[-1]
+        steep_id = get_steep_id(tea_tag)
+        # The id picks the file the steep is written to, it has to stay in the cup
+        if steep_id is None:
+            raise ValueError(f"Invalid steep id {tea_tag.props.get(STEEP_ID_PROP)!r}")
 
-        steep_path = os.path.join(ctx.path_to_teacup_folder, "Steep." + extension)
+        steep_path = os.path.join(
+            ctx.path_to_teacup_folder, f"Steep{steep_id}." + extension
+        )
         loading_component_path = os.path.join(
             ctx.path_to_teacup_folder, "Heating." + extension
         )
@@ -80,73 +225,310 @@ class Main:
         if os.path.exists(steep_path):
             with open(steep_path, "r") as steep_file:
                 steep_content = steep_file.read()
+            # The placeholder or a component that stopped streaming halfway is nothing to build on
+            if not is_steeped(steep_content):
+                steep_content = ""
 
-        steep_ctx = SteepContext(
+        return SteepContext(
             **ctx.model_dump(),
             loading_component_path=loading_component_path,
             steep_path=steep_path,
             steep_content=steep_content,
-            tea_import_statement=tea_import_statement,
+            tea_import_statement=get_tea_import_statement(ctx.file_path),
             tea_tag=tea_tag,
         )
-        pour = tea_tag.model_dump().get("props", {}).get("pour", None)
 
-        if pour:
-            log.info(f"Pouring {pour} component...")
-            self.tea_agent.pour(component_name=pour, ctx=steep_ctx)
-            self.tea_agent.print_costs()
-        else:
-            log.info("Steeping new component...")
-            self.tea_agent.steep(ctx=steep_ctx)
-            self.tea_agent.print_costs()
+    def make_agent(self) -> "TeaAgent":
+        from agent import TeaAgent
+
+        # Each job gets its own agent, everything else is shared
+        return TeaAgent(
+            llm=self.llm,
+            slots=self.llm_slots,
+            async_slots=self.llm_loop.slots if self.llm_loop else None,
+            cache=self.cache,
+            fingerprints=self.fingerprints,
+            project_index=self.project_index,
+            prompt_token_budget=self.prompt_token_budget,
+            metrics=self.metrics,
+            refine=self.refine_steeps,
+            component_index=self.component_index,
+            related_components=self.related_components,
+        )
+
+    def process_tea_tag(
+        self, steep_ctx: SteepContext, generation: Generation = None
+    ) -> bool:
+        """
+        Steeps (WIP version) or Pours (finalizes) <Tea> components.
+        Returns whether it succeeded.
+        """
+        pour = steep_ctx.tea_tag.props.get("pour", None)
+        kind = "pour" if pour else "steep"
+        tea_agent = self.make_agent()
+
+        succeeded = False
+        try:
+            if pour:
+                log.info(f"Pouring {pour} component...")
+                tea_agent.pour(component_name=pour, ctx=steep_ctx)
+                succeeded = True
+            else:
+                log.info("Steeping new component...")
+                succeeded = tea_agent.steep(ctx=steep_ctx, generation=generation)
+            return succeeded
+        finally:
+            tea_agent.record_metrics(
+                kind,
+                steep_ctx.file_path,
+                succeeded=succeeded,
+                cancelled=bool(generation and generation.cancelled),
+            )
+
+    async def aprocess_tea_tag(
+        self, steep_ctx: SteepContext, generation: Generation = None
+    ) -> bool:
+        """
+        Same as process_tea_tag, on the event loop
+        """
+        pour = steep_ctx.tea_tag.props.get("pour", None)
+        kind = "pour" if pour else "steep"
+        tea_agent = self.make_agent()
+
+        succeeded = False
+        try:
+            if pour:
+                log.info(f"Pouring {pour} component...")
+                await tea_agent.apour(component_name=pour, ctx=steep_ctx)
+                succeeded = True
+            else:
+                log.info("Steeping new component...")
+                succeeded = await tea_agent.asteep(ctx=steep_ctx, generation=generation)
+            return succeeded
+        finally:
+            tea_agent.record_metrics(
+                kind,
+                steep_ctx.file_path,
+                succeeded=succeeded,
+                cancelled=bool(generation and generation.cancelled),
+            )
+
+    def finish_steep(
+        self, steep_ctx: SteepContext, generation: Generation, steeped: bool
+    ):
+        latest = self.generations.finish(generation)
+        # Let the next save retry the tag even if it didn't change,
+        # unless a newer save took over the tag and recorded its own fingerprint
+        if not steeped and latest:
+            self.fingerprints.forget_tag(
+                steep_ctx.file_path, steep_ctx.tea_tag.props[STEEP_ID_PROP]
+            )
+
+    def steep_tea_tag(self, steep_ctx: SteepContext, generation: Generation):
+        steeped = False
+        try:
+            steeped = self.process_tea_tag(steep_ctx, generation=generation)
+        except Exception as e:
+            log.error(f"Failed to steep {steep_ctx.steep_path}")
+            log.exception(e)
+        finally:
+            self.finish_steep(steep_ctx, generation, steeped)
+
+    async def asteep_tea_tag(self, steep_ctx: SteepContext, generation: Generation):
+        steeped = False
+        try:
+            steeped = await self.aprocess_tea_tag(steep_ctx, generation=generation)
+        except Exception as e:
+            log.error(f"Failed to steep {steep_ctx.steep_path}")
+            log.exception(e)
+        finally:
+            self.finish_steep(steep_ctx, generation, steeped)
+
+    def write_teacup(
+        self,
+        steep_ctxs: List[SteepContext],
+        heating_ctxs: List[SteepContext],
+        ctx: FileContext,
+    ):
+        """
+        Writes the loading component, a placeholder for every steep being generated and the Tea component rendering them
+        """
+        extension = ctx.file_path.split(".")[-1]
+        os.makedirs(ctx.path_to_teacup_folder, exist_ok=True)
+
+        # The scaffold stays in place between saves, only what changed is written
+        sync_file(
+            os.path.join(ctx.path_to_teacup_folder, "Heating." + extension),
+            create_loading_component(),
+        )
+
+        for steep_ctx in heating_ctxs:
+            # A steep being refined stays on screen until the new version streams in
+            if not steep_ctx.steep_content:
+                sync_file(steep_ctx.steep_path, create_steep_component())
+
+        steep_ids = [steep_ctx.tea_tag.props[STEEP_ID_PROP] for steep_ctx in steep_ctxs]
+        sync_file(
+            os.path.join(ctx.path_to_teacup_folder, "Tea." + extension),
+            create_tea_component(steep_ids, extension=extension),
+        )
+
+    def remove_teacup(self, path_to_teacup_folder: str):
+        """
+        Removes the cup of a file, and the cup folder once no file is using it
+        """
+        if os.path.exists(path_to_teacup_folder):
+            log.warning(f"Removing {path_to_teacup_folder}...")
+            shutil.rmtree(path_to_teacup_folder)
+
+        cup_folder = os.path.dirname(path_to_teacup_folder)
+        if self.tag_index.folder_has_tags(os.path.dirname(cup_folder)):
+            return
+        try:
+            os.rmdir(cup_folder)
+        except OSError:
+            # Gone already, or still holding the cup of a file Tea doesn't know about
+            pass
 
     def process_file(self, file_path: str, root_directory=None):
         """
-        Detects and processes <Tea> tags.
+        Detects and processes every <Tea> tag in a file.
         """
         with open(file_path, "r") as file:
             file_content = file.read()
 
-        path_to_file_folder = "/".join(file_path.split("/")[:-1])
-        path_to_teacup_folder = os.path.join(path_to_file_folder, "cup")
-        if not os.path.exists(path_to_teacup_folder):
-            os.mkdir(path_to_teacup_folder)
+        # Saving in place empties the file before writing it, the write queues it again
+        if not file_content:
+            log.debug(f"{file_path} is empty")
+            return
+
+        # Our own writes count too, e.g. a component that was just poured
+        if self.related_components:
+            self.component_index.update(file_path, file_content)
+
+        # The event came from one of our own writes
+        if self.fingerprints.is_own_write(file_path, file_content):
+            log.debug(f"Skipping our own write to {file_path}")
+            return
+
+        path_to_teacup_folder = get_teacup_folder(file_path)
+        tea_import_statement = get_tea_import_statement(file_path)
+
+        # Parse the file once, every rewrite below is spliced into this parse
+        sfc = Sfc(file_content)
+        tea_tags = sfc.tags
+        if not self.fingerprints.tags_changed(file_path, tea_tags):
+            log.debug(f"No <Tea> tag changed in {file_path}")
+            # e.g. an editor moving the file away to save it took it out of the index
+            self.tag_index.set_tags(file_path, tea_tags)
+            return
+
+        if not tea_tags:
+            log.info(f"No <Tea> tag found in {file_path}")
+            self.generations.cancel_file(file_path)
+
+            # Remove import from file
+            file_content_no_import = sfc.splice(
+                sfc.import_edits(remove=[tea_import_statement])
+            )
+
+            # Write the updated content without the import, writing an unchanged file would only queue it again
+            if file_content_no_import != file_content:
+                self.fingerprints.write_file(file_path, file_content_no_import)
+            self.tag_index.set_tags(file_path, tea_tags)
+            # Remove the teacup directory and everything inside it, once nothing imports it for the dev server to miss
+            self.remove_teacup(path_to_teacup_folder)
+            self.fingerprints.record_tags(file_path, tea_tags)
+            if self.model_keeper:
+                self.model_keeper.tags_seen(file_path, has_tags=False)
+            return
+
+        log.info(f"{len(tea_tags)} <Tea> tag(s) found in {file_path}")
+        edits = steep_id_edits(tea_tags)
+        if any(not tea_tag.props.get("pour", None) for tea_tag in tea_tags):
+            # Add the import to the top of the file
+            edits += sfc.import_edits(add=[tea_import_statement])
+        new_file_content = sfc.splice(edits)
+        if edits:
+            # The offsets of the tags moved with the edits
+            tea_tags = Sfc(new_file_content).tags
 
         ctx = FileContext(
             file_path=file_path,
-            file_content=file_content,
+            file_content=new_file_content,
             root_directory=root_directory,
             path_to_teacup_folder=path_to_teacup_folder,
-            packages=get_packages(root_directory),
+            packages=self.project_index.packages(),
         )
+        steep_ctxs = [self.make_steep_context(tea_tag, ctx) for tea_tag in tea_tags]
+        steeping = [c for c in steep_ctxs if not c.tea_tag.props.get("pour", None)]
+        pouring = [c for c in steep_ctxs if c.tea_tag.props.get("pour", None)]
 
-        # Extract and process <Tea> tag
-        tea_tag = extract_tag(file_content, tag="Tea")
-        if tea_tag:
-            log.info(f"<Tea> tag found in {file_path}")
-            self.process_tea_tag(tea_tag=tea_tag, ctx=ctx)
-            return
-        else:
-            log.info(f"No <Tea> tag found in {file_path}")
-            # Remove the teacup directory and everything inside it
-            # TODO: Only remove when no <Tea> tags are found in the repo in general
-            log.warning(f"Removing {path_to_teacup_folder}...")
-            shutil.rmtree(ctx.path_to_teacup_folder)
-
-            # Remove import from file
-            file_content_no_import, _ = set_import(
-                ctx.file_content, tea_import_statement, remove=True
+        # Tags that were removed or are being poured don't need their steeps anymore
+        self.generations.cancel_file(
+            file_path,
+            keep=[(file_path, c.tea_tag.props[STEEP_ID_PROP]) for c in steeping],
+        )
+        # A save only steeps the tags it changed, and the ones that never finished
+        changed = self.fingerprints.changed_tags(
+            file_path, [c.tea_tag for c in steeping]
+        )
+        changed_ids = {tea_tag.props[STEEP_ID_PROP] for tea_tag in changed}
+        generations = []
+        for steep_ctx in steeping:
+            steep_id = steep_ctx.tea_tag.props[STEEP_ID_PROP]
+            if steep_id not in changed_ids and not self.is_unfinished(
+                file_path, steep_ctx.tea_tag
+            ):
+                log.debug(f"{steep_ctx.steep_path} didn't change")
+                continue
+            generation = self.generations.begin(
+                (file_path, steep_id),
+                tag_fingerprint(steep_ctx.tea_tag),
             )
+            if generation is None:
+                log.info(f"{steep_ctx.steep_path} is already being steeped")
+                continue
+            generations.append((steep_ctx, generation))
+
+        if steeping:
+            self.write_teacup(steeping, [c for c, _ in generations], ctx)
+
+        # Write the steep ids and the import in one go, before anything is generated
+        if new_file_content != file_content:
+            self.fingerprints.write_file(file_path, new_file_content)
+            for steep_ctx in steep_ctxs:
+                steep_ctx.file_content = new_file_content
+
+        # Pours rewrite the parent file, so they go one at a time
+        for steep_ctx in pouring:
+            if self.llm_loop:
+                self.llm_loop.run(self.aprocess_tea_tag(steep_ctx))
+            else:
+                self.process_tea_tag(steep_ctx)
+
+        # Poured tags are gone from the file now, what is left is steeping
+        self.fingerprints.record_tags(file_path, [c.tea_tag for c in steeping])
+        self.tag_index.set_tags(file_path, [c.tea_tag for c in steeping])
+        if self.model_keeper:
+            self.model_keeper.tags_seen(file_path, has_tags=bool(steeping))
 
-            # Write the updated content without the import
-            with open(file_path, "w") as file:
-                file.write(file_content_no_import)
+        # Steeps only write to their own steep file and are generated together
+        for steep_ctx, generation in generations:
+            if self.llm_loop:
+                self.llm_loop.submit(self.asteep_tea_tag(steep_ctx, generation))
+            else:
+                self.steep_pool.submit(self.steep_tea_tag, steep_ctx, generation)
+
+        if not steeping:
+            self.remove_teacup(path_to_teacup_folder)
 
 
 def get_config_from_environment():
     """
     Returns a config dict from the environment variables.
     """
+    openai_key = os.getenv("OPENAI_KEY", None)
     config = EnvConfig(
         patterns=os.getenv("PATTERNS", CONFIG_DEFAULTS["PATTERNS"]).split(","),
         root_directory=os.getenv("ROOT_DIRECTORY", CONFIG_DEFAULTS["ROOT_DIRECTORY"]),
@@ -156,8 +538,42 @@ def get_config_from_environment():
         model=os.getenv("MODEL", CONFIG_DEFAULTS["MODEL"]),
         temperature=float(os.getenv("TEMPERATURE", CONFIG_DEFAULTS["TEMPERATURE"])),
         base_url="http://" + os.getenv("OLLAMA_HOST", "localhost:11434"),
-        openai_key=os.getenv("OPENAI_KEY", None),
+        openai_key=openai_key,
         log_level=os.getenv("LOG_LEVEL", CONFIG_DEFAULTS["LOG_LEVEL"]),
+        workers=int(os.getenv("WORKERS", CONFIG_DEFAULTS["WORKERS"])),
+        llm_concurrency=int(
+            os.getenv(
+                "LLM_CONCURRENCY",
+                (
+                    CONFIG_DEFAULTS["OPENAI_CONCURRENCY"]
+                    if openai_key
+                    else CONFIG_DEFAULTS["OLLAMA_CONCURRENCY"]
+                ),
+            )
+        ),
+        cache_directory=os.getenv(
+            "CACHE_DIRECTORY", CONFIG_DEFAULTS["CACHE_DIRECTORY"]
+        ),
+        cache_max_mb=int(os.getenv("CACHE_MAX_MB", CONFIG_DEFAULTS["CACHE_MAX_MB"])),
+        prompt_token_budget=int(
+            os.getenv("PROMPT_TOKEN_BUDGET", CONFIG_DEFAULTS["PROMPT_TOKEN_BUDGET"])
+        ),
+        metrics_directory=os.getenv(
+            "METRICS_DIRECTORY", CONFIG_DEFAULTS["METRICS_DIRECTORY"]
+        ),
+        async_llm=os.getenv("ASYNC_LLM", CONFIG_DEFAULTS["ASYNC_LLM"]).lower()
+        == "true",
+        keep_alive_minutes=int(
+            os.getenv("KEEP_ALIVE_MINUTES", CONFIG_DEFAULTS["KEEP_ALIVE_MINUTES"])
+        ),
+        idle_minutes=int(os.getenv("IDLE_MINUTES", CONFIG_DEFAULTS["IDLE_MINUTES"])),
+        refine_steeps=os.getenv(
+            "REFINE_STEEPS", CONFIG_DEFAULTS["REFINE_STEEPS"]
+        ).lower()
+        == "true",
+        related_components=int(
+            os.getenv("RELATED_COMPONENTS", CONFIG_DEFAULTS["RELATED_COMPONENTS"])
+        ),
     )
 
     if not config.root_directory:
@@ -166,31 +582,47 @@ def get_config_from_environment():
     return config
 
 
-if __name__ == "__main__":
-    if watcher:
-        watcher.stop()
-
-    config = get_config_from_environment()
+def create_llm(config: EnvConfig) -> Union["BaseLLM", "BaseChatModel"]:
+    """
+    Creates the model from the config, OpenAI when there is a key and Ollama otherwise.
+    Only the chosen backend is imported.
+    """
     if config.openai_key:
+        with timed_import("langchain_openai"):
+            from langchain_openai import ChatOpenAI
+
         model = (
             "gpt-3.5-turbo"
             if config.model == CONFIG_DEFAULTS["MODEL"]
             else config.model
         )
-        llm = ChatOpenAI(
+        return ChatOpenAI(
             name=model,
             model=model,
             temperature=config.temperature,
             api_key=config.openai_key,
             max_tokens=1000,
         )
-    else:
-        llm = Ollama(
-            name=config.model,
-            model=config.model,
-            temperature=config.temperature,
-            base_url=config.base_url,
-        )
+    with timed_import("ollama"):
+        from connections import ConnectionPool, PooledOllama
+
+    return PooledOllama(
+        pool=ConnectionPool(max_connections=config.llm_concurrency),
+        name=config.model,
+        model=config.model,
+        temperature=config.temperature,
+        base_url=config.base_url,
+        keep_alive=(
+            f"{config.keep_alive_minutes}m" if config.keep_alive_minutes > 0 else None
+        ),
+    )
+
+
+if __name__ == "__main__":
+    if watcher:
+        watcher.stop()
+
+    config = get_config_from_environment()
 
-    main = Main(llm=llm, config=config)
+    main = Main(llm=None, config=config, load_llm=lambda: create_llm(config))
     main.run()
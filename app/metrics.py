@@ -0,0 +1,137 @@
+import os
+import tempfile
+import time
+from collections import defaultdict
+from threading import Lock
+from typing import Dict, Tuple
+
+from pydantic import BaseModel
+
+
+class GenerationMetrics(BaseModel):
+    """
+    What one steep or pour took. Times are in seconds and None when nothing was streamed, e.g. for cached responses.
+    """
+
+    timestamp: float
+    kind: str
+    model: str
+    file_path: str
+    succeeded: bool
+    cancelled: bool
+    cached: bool
+    retries: int
+    prompt_tokens: int
+    completion_tokens: int
+    # Waiting for a free slot on the backend
+    queue_seconds: float | None
+    time_to_first_token: float | None
+    stream_seconds: float | None
+    # Output tokens per second after the first token, i.e. without the prefill
+    tokens_per_second: float | None
+    cost: float | None
+
+
+# name -> (type, help) of the series kept for every kind and model
+SERIES = {
+    "tea_generations_total": ("counter", "Steeps and pours"),
+    "tea_generations_cached_total": (
+        "counter",
+        "Steeps and pours answered by the cache",
+    ),
+    "tea_generations_cancelled_total": ("counter", "Steeps superseded by a newer save"),
+    "tea_generations_failed_total": ("counter", "Steeps and pours that failed"),
+    "tea_generation_retries_total": ("counter", "Retries after an unusable response"),
+    "tea_prompt_tokens_total": ("counter", "Tokens sent to the model"),
+    "tea_completion_tokens_total": ("counter", "Tokens generated by the model"),
+    "tea_queue_seconds": (
+        "summary",
+        "Time spent waiting for a free slot on the backend",
+    ),
+    "tea_time_to_first_token_seconds": (
+        "summary",
+        "Time until the first token was streamed",
+    ),
+    "tea_stream_seconds": ("summary", "Time spent streaming the whole response"),
+    "tea_decode_seconds": ("summary", "Time spent streaming after the first token"),
+}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRecorder:
+    """
+    Appends the metrics of every generation to a JSONL file, and keeps totals per kind and model
+    in a Prometheus text file, e.g. for the node exporter's textfile collector.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.expanduser(directory)
+        self.jsonl_path = os.path.join(self.directory, "generations.jsonl")
+        self.prometheus_path = os.path.join(self.directory, "tea.prom")
+        self._lock = Lock()
+        # (kind, model) -> series name -> value, summaries keep name_sum and name_count
+        self._totals: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+        os.makedirs(self.directory, exist_ok=True)
+
+    def record(self, metrics: GenerationMetrics):
+        with self._lock:
+            with open(self.jsonl_path, "a") as file:
+                file.write(metrics.model_dump_json() + "\n")
+
+            totals = self._totals[(metrics.kind, metrics.model)]
+            totals["tea_generations_total"] += 1
+            totals["tea_generations_cached_total"] += metrics.cached
+            totals["tea_generations_cancelled_total"] += metrics.cancelled
+            totals["tea_generations_failed_total"] += not (
+                metrics.succeeded or metrics.cancelled
+            )
+            totals["tea_generation_retries_total"] += metrics.retries
+            totals["tea_prompt_tokens_total"] += metrics.prompt_tokens
+            totals["tea_completion_tokens_total"] += metrics.completion_tokens
+
+            decode_seconds = None
+            if (
+                metrics.stream_seconds is not None
+                and metrics.time_to_first_token is not None
+            ):
+                decode_seconds = metrics.stream_seconds - metrics.time_to_first_token
+            for name, value in (
+                ("tea_queue_seconds", metrics.queue_seconds),
+                ("tea_time_to_first_token_seconds", metrics.time_to_first_token),
+                ("tea_stream_seconds", metrics.stream_seconds),
+                ("tea_decode_seconds", decode_seconds),
+            ):
+                if value is not None:
+                    totals[name + "_sum"] += value
+                    totals[name + "_count"] += 1
+
+            self._write_prometheus()
+
+    def _write_prometheus(self):
+        lines = []
+        for name, (kind, description) in SERIES.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            suffixes = ["_sum", "_count"] if kind == "summary" else [""]
+            for (generation_kind, model), totals in sorted(self._totals.items()):
+                labels = f'kind="{_escape(generation_kind)}",model="{_escape(model)}"'
+                for suffix in suffixes:
+                    lines.append(
+                        f"{name}{suffix}{{{labels}}} {totals[name + suffix]:g}"
+                    )
+        lines.append(
+            "# HELP tea_metrics_updated_timestamp_seconds When the metrics were last updated"
+        )
+        lines.append("# TYPE tea_metrics_updated_timestamp_seconds gauge")
+        lines.append(f"tea_metrics_updated_timestamp_seconds {time.time():.3f}")
+
+        # Scrapers must never see a half written file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prometheus_path)
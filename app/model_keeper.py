@@ -0,0 +1,89 @@
+import os
+import time
+from threading import Event, Lock, Thread
+from typing import TYPE_CHECKING
+
+from helpers import log
+
+if TYPE_CHECKING:
+    from connections import PooledOllama
+
+# How soon to try again when Ollama couldn't be reached, e.g. while it is still starting
+RETRY_SECONDS = 10
+
+
+class ModelKeeper:
+    """
+    Keeps the Ollama model loaded while it is needed, so that no steep waits for the model to load.
+    The model is loaded when Tea starts and kept loaded while any file has a <Tea> tag.
+    Once no file has one and none was saved for the idle timeout, the model is released.
+    """
+
+    def __init__(self, llm: "PooledOllama", keep_alive_minutes: int, idle_minutes: int):
+        self.llm = llm
+        self.keep_alive = f"{keep_alive_minutes}m"
+        # Refresh well before Ollama would unload the model on its own
+        self.refresh_seconds = keep_alive_minutes * 60 / 2
+        self.idle_seconds = idle_minutes * 60
+        self._lock = Lock()
+        self._files: set[str] = set()
+        self._last_used = time.monotonic()
+        self._loaded = False
+        self._wake = Event()
+        self._thread = Thread(target=self._run, name="tea-model-keeper", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def tags_seen(self, file_path: str, has_tags: bool):
+        """
+        Tells the keeper whether a file has <Tea> tags left after processing it
+        """
+        with self._lock:
+            if has_tags:
+                self._files.add(file_path)
+            else:
+                self._files.discard(file_path)
+            self._last_used = time.monotonic()
+            loaded = self._loaded
+        if has_tags and not loaded:
+            self._wake.set()
+
+    def remove(self, path: str):
+        """
+        Forgets a deleted or moved file, or every file in a directory
+        """
+        prefix = os.path.join(path, "")
+        with self._lock:
+            self._files = {
+                p for p in self._files if p != path and not p.startswith(prefix)
+            }
+
+    def _is_idle(self) -> bool:
+        with self._lock:
+            return (
+                not self._files
+                and time.monotonic() - self._last_used > self.idle_seconds
+            )
+
+    def _run(self):
+        while True:
+            wait = self.refresh_seconds
+            try:
+                if not self._is_idle():
+                    started = time.perf_counter()
+                    self.llm.keep_loaded(self.keep_alive)
+                    if not self._loaded:
+                        log.info(
+                            f"Loaded {self.llm.model} in {time.perf_counter() - started:.2f}s"
+                        )
+                    self._loaded = True
+                elif self._loaded:
+                    log.info(f"No <Tea> tag left, releasing {self.llm.model}")
+                    self.llm.keep_loaded(0)
+                    self._loaded = False
+            except Exception as e:
+                log.warning(f"Failed to keep {self.llm.model} loaded: {e}")
+                wait = RETRY_SECONDS
+            self._wake.wait(wait)
+            self._wake.clear()
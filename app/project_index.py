@@ -0,0 +1,108 @@
+import os
+from threading import Lock
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+from helpers import (
+    Packages,
+    get_available_components,
+    get_packages,
+    get_path_aliases,
+    get_paths_from_tsconfig,
+    log,
+)
+
+
+class ProjectIndex:
+    """
+    Parses what Tea needs to know about the project as a whole once, and keeps it until the watcher
+    sees one of the files it was read from change.
+
+    Every entry remembers the paths it depends on. A directory in there means its listing,
+    which only changes when something is created, deleted or moved inside of it.
+    """
+
+    def __init__(self, root_directory: str):
+        self.root_directory = os.path.abspath(root_directory)
+        self._lock = Lock()
+        self._entries: Dict[str, Tuple[Any, Set[str]]] = {}
+
+    def _get(self, name: str, load: Callable[[], Tuple[Any, List[str]]]) -> Any:
+        with self._lock:
+            if name in self._entries:
+                return self._entries[name][0]
+
+        value, dependencies = load()
+        with self._lock:
+            self._entries[name] = (
+                value,
+                {os.path.abspath(path) for path in dependencies},
+            )
+        return value
+
+    def watched_directories(self) -> List[str]:
+        """
+        Directories the index reads from that are usually ignored, so the watcher has to watch them anyway
+        """
+        return [os.path.join(self.root_directory, ".nuxt")]
+
+    def invalidate(self, path: str, structural: bool = False):
+        """
+        Drops the entries read from the path. Creating, deleting or moving the path is structural
+        and also changes the listing of its directory.
+        """
+        path = os.path.abspath(path)
+        changed = {path, os.path.dirname(path)} if structural else {path}
+        with self._lock:
+            for name, (_, dependencies) in list(self._entries.items()):
+                if dependencies & changed:
+                    log.debug(f"{path} changed, dropping {name} from the project index")
+                    del self._entries[name]
+
+    def packages(self) -> Packages:
+        def load():
+            return get_packages(self.root_directory), [
+                os.path.join(self.root_directory, "package.json")
+            ]
+
+        return self._get("packages", load)
+
+    def root_files(self) -> List[str]:
+        def load():
+            return os.listdir(self.root_directory), [self.root_directory]
+
+        return self._get("root_files", load)
+
+    def tsconfig_paths(self) -> Dict[str, List[str]]:
+        def load():
+            read_files = []
+            try:
+                return (
+                    get_paths_from_tsconfig(self.root_directory, read_files),
+                    read_files,
+                )
+            except FileNotFoundError:
+                # Cache the miss too, the file showing up invalidates it
+                return {}, read_files
+
+        return self._get("tsconfig_paths", load)
+
+    def path_aliases(self) -> Dict[str, str]:
+        def load():
+            read_files = []
+            try:
+                return get_path_aliases(self.root_directory, read_files), read_files
+            except FileNotFoundError:
+                return {}, read_files
+
+        return self._get("path_aliases", load)
+
+    def available_components(self) -> str | None:
+        def load():
+            return get_available_components(
+                self.root_directory, root_files=self.root_files()
+            ), [
+                self.root_directory,
+                os.path.join(self.root_directory, ".nuxt", "components.d.ts"),
+            ]
+
+        return self._get("available_components", load)
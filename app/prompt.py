@@ -1,7 +1,10 @@
+from typing import Dict, List, Tuple
+
 from helpers import Packages
 from langchain.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.pydantic_v1 import BaseModel, Field
+from streaming import parse_json_object
 
 
 class ComponentLocation(BaseModel):
@@ -13,6 +16,10 @@ class ComponentLocation(BaseModel):
     )
 
 
+# The model is done once the code fence closes after the last block of the component.
+# Matching on the closing tag keeps the opening fence from stopping it. The stop sequence is cut from the response, which loses the closing tag.
+STOP_SEQUENCES = ["</style>\n```", "</template>\n```", "</script>\n```"]
+
 LOGICAL_PATH_EXAMPLES = """
 Examples of VALID logical paths:
 ```
@@ -86,6 +93,25 @@ const { foo, bar } = toRefs(props);
 // Usage of above: foo.value, bar.value
 """
 
+EXAMPLE_EDIT_SCRIPT = """
+<<<<<<< SEARCH
+    <button class="save">Save</button>
+=======
+    <button class="save" @click="save">Save</button>
+>>>>>>> REPLACE
+<<<<<<< SEARCH
+const props = defineProps({
+=======
+const emit = defineEmits(["save"]);
+
+function save() {
+    emit("save");
+}
+
+const props = defineProps({
+>>>>>>> REPLACE
+"""
+
 
 def write_component_prompt(
     user_query: str,
@@ -149,6 +175,69 @@ Fill out/edit this component to comply with the user's query. Do not change the
 """
 
 
+def write_refine_prompt(
+    user_query: str,
+    steep_component_content: str,
+    parent_file_content: str,
+    packages: Packages,
+    source_file: str,
+    available_components: str = None,
+):
+    """
+    Asks for the changes to the component the tag already has as SEARCH/REPLACE blocks, instead of the whole file
+    """
+    return f"""
+You are a pragmatic principal open-source frontend engineer specializing in the Vue ecosystem.
+You are about to change an existing Vue component file, {source_file}, so that it does what the user query asks for:
+```
+{user_query}
+```
+
+{available_components if available_components else ''}
+
+This is the parent component file: it uses the <Tea> component to render the component that you are changing. DO NOT CHANGE THE PARENT COMPONENT.
+```
+{parent_file_content}
+```
+
+You have access to the following packages:
+```
+{packages}
+```
+
+This is the current content of {source_file}:
+```vue
+{steep_component_content}
+```
+
+Output ONLY the changes to {source_file} as SEARCH/REPLACE blocks WITHIN triple backticks (```) AND NOTHING ELSE.
+Copy every SEARCH block exactly from the current content, with its indentation, and with just enough lines to be found exactly once.
+The REPLACE block holds the lines that take its place. Leave out everything that stays the same.
+The changed code must be complete and fully functional. NO PLACEHOLDERS. NO COMMENTS.
+If {source_file} already does what the user query asks for, output an empty code block.
+For example:
+```
+{EXAMPLE_EDIT_SCRIPT.strip()}
+```
+"""
+
+
+def write_related_components(components: List[Tuple[str, str | None]]) -> str:
+    """
+    Lists the components of the project that fit the query, each as its usage below the statement importing it
+    """
+    listing = "\n".join(
+        f"{import_statement}\n{signature}" if import_statement else signature
+        for signature, import_statement in components
+    )
+    return f"""
+These components of the project fit the user query. USE THEM INSTEAD OF WRITING THEM AGAIN. Import them with the statement above them, components without one are imported automatically, DO NOT IMPORT THOSE:
+```
+{listing}
+```
+"""
+
+
 def make_component_output_parser() -> JsonOutputParser:
     """
     Builds the output parser for use in the chain
@@ -157,6 +246,24 @@ def make_component_output_parser() -> JsonOutputParser:
     return JsonOutputParser(pydantic_object=ComponentLocation)
 
 
+def parse_component_location(response: str) -> Dict[str, str]:
+    """
+    Parses the location the model answered with, repairing it where possible instead of asking again
+    """
+    location = parse_json_object(response)
+    # Some models wrap the location in the schema from the format instructions
+    if isinstance(location.get("properties", None), dict):
+        location = location["properties"]
+    missing = [
+        key
+        for key in ComponentLocation.__fields__
+        if not isinstance(location.get(key, None), str)
+    ]
+    if missing:
+        raise ValueError(f"The location is missing {', '.join(missing)}: {response}")
+    return location
+
+
 def write_component_location_prompt(parser: JsonOutputParser):
     """
     Constructs a prompt template for using when determining where to put the component file
@@ -0,0 +1,42 @@
+from threading import Thread
+from typing import Callable
+
+from helpers import log
+from jobs import JobQueue
+
+
+class Scheduler:
+    """
+    Runs jobs from a JobQueue on a fixed pool of worker threads.
+    How many of them may talk to the LLM at once is limited separately by the backend's slots.
+    """
+
+    def __init__(
+        self, jobs: JobQueue, handler: Callable[[str], None], max_workers: int = 4
+    ):
+        self.jobs = jobs
+        self.handler = handler
+        self.workers = [
+            Thread(target=self._work, name=f"tea-worker-{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+
+    def _work(self):
+        while True:
+            path = self.jobs.get()
+            log.info(f"File changed: {path}")
+            try:
+                self.handler(path)
+            except Exception as e:
+                log.error(f"Failed to process {path}")
+                log.exception(e)
+            finally:
+                self.jobs.done(path)
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def join(self):
+        for worker in self.workers:
+            worker.join()
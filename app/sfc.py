@@ -0,0 +1,345 @@
+import re
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+
+from helpers import STEEP_ID_PROP, TeaTag, get_steep_id
+from pydantic import BaseModel
+
+# A comment or the start of a top-level block, the text between blocks is short
+BLOCK_START = re.compile(r"<!--|<(template|script|style)(?=[\s/>])")
+# The attributes and the end of an opening tag, a quoted value may hold a > of its own
+OPENING_TAG_END = re.compile(
+    r"""((?:\s+[^\s"'<>/=]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'<>]+))?)*)\s*(/?)>"""
+)
+CLOSING_TAG_END = re.compile(r"\s*>")
+# Top-level blocks that hold code instead of markup
+RAW_BLOCKS = ("script", "style")
+# The props of a tag, e.g. steep="1" or a bare pour
+PROP = re.compile(r'(\w+)(?:=["\']([^"\']+)["\']|\b)')
+# An import statement, which may span lines and leave out the semicolon
+IMPORT = re.compile(
+    r"""^[ \t]*import\b[^;'"]*?['"][^'"\n]*['"][ \t]*;?""", re.MULTILINE
+)
+
+# Replaces content[start:end] with the text
+Edit = Tuple[int, int, str]
+
+
+@lru_cache(maxsize=None)
+def get_template_stop(tag: str) -> re.Pattern:
+    """
+    Finds where the next comment, template or tag named like tag starts in a template.
+    Every branch starts with its own literal, which the regex engine skips ahead to.
+    """
+    return re.compile(
+        "|".join(
+            ["<!--"]
+            + [
+                rf"{start}(?=[\s/>])"
+                for name in ("template", tag)
+                for start in (f"<{name}", f"</{name}")
+            ]
+        )
+    )
+
+
+class SfcBlock(BaseModel):
+    tag: str
+    attributes: str
+    start: int
+    content_start: int
+    content_end: int
+    end: int
+
+
+class Sfc:
+    """
+    A Vue single file component tokenized in one pass: its top-level blocks and the tags named like tag in its template, with their offsets.
+    Comments and the code in script and style blocks are skipped.
+    Rewrites are edits on the content that are spliced in together, so the offsets stay valid until then.
+    """
+
+    def __init__(self, content: str, tag: str = "Tea"):
+        self.content = content
+        self.blocks: List[SfcBlock] = []
+        self.tags: List[TeaTag] = []
+        self._tokenize(get_template_stop(tag), re.compile(tag))
+
+    def _tokenize(self, template_stop: re.Pattern, tag: re.Pattern):
+        content = self.content
+        pos = 0
+        while match := BLOCK_START.search(content, pos):
+            name = match.group(1)
+            if name is None:
+                pos = self._skip_comment(match.end())
+                continue
+
+            rest = OPENING_TAG_END.match(content, match.end())
+            if rest is None:
+                pos = match.end()
+                continue
+            if rest.group(2):
+                # A self-closing block has nothing in it
+                pos = rest.end()
+                continue
+
+            attributes = rest.group(1).strip()
+            if name in RAW_BLOCKS:
+                # Skip the code, it can be anything but its closing tag
+                content_end = content.find(f"</{name}", rest.end())
+                if content_end == -1:
+                    content_end = pos = len(content)
+                else:
+                    end_match = CLOSING_TAG_END.match(
+                        content, content_end + len(name) + 2
+                    )
+                    pos = end_match.end() if end_match else content_end
+            else:
+                content_end, pos = self._tokenize_template(
+                    rest.end(), template_stop, tag
+                )
+            self.blocks.append(
+                SfcBlock(
+                    tag=name,
+                    attributes=attributes,
+                    start=match.start(),
+                    content_start=rest.end(),
+                    content_end=content_end,
+                    end=pos,
+                )
+            )
+
+        self.tags.sort(key=lambda tea_tag: tea_tag.start)
+
+    def _skip_comment(self, pos: int) -> int:
+        end = self.content.find("-->", pos)
+        # An unclosed comment runs to the end
+        return end + 3 if end != -1 else len(self.content)
+
+    def _tokenize_template(
+        self, pos: int, template_stop: re.Pattern, tag: re.Pattern
+    ) -> Tuple[int, int]:
+        """
+        Finds the tags in the template starting at pos, returns where its content and closing tag end
+        """
+        content = self.content
+        # The tags asked for that are still open, innermost last
+        open_tags: List[Tuple[str, int, int, int, int]] = []
+        # Templates nest for slots, only the outermost one is a block
+        depth = 1
+        while match := template_stop.search(content, pos):
+            start, name_end = match.span()
+            if match.group(0) == "<!--":
+                pos = self._skip_comment(name_end)
+                continue
+
+            closing = content[start + 1] == "/"
+            name = content[start + 1 + closing : name_end]
+            if closing:
+                end_match = CLOSING_TAG_END.match(content, name_end)
+                if end_match is None:
+                    pos = name_end
+                    continue
+                pos = end_match.end()
+                if tag.fullmatch(name):
+                    self._close_tag(open_tags, name, start, pos)
+                if name == "template":
+                    depth -= 1
+                    if depth == 0:
+                        return start, pos
+                continue
+
+            rest = OPENING_TAG_END.match(content, name_end)
+            if rest is None:
+                pos = name_end
+                continue
+            pos = rest.end()
+            if rest.group(2):
+                if tag.fullmatch(name):
+                    self._add_tag(name, start, pos, name_end, rest.end(1))
+                continue
+            if name == "template":
+                depth += 1
+            if tag.fullmatch(name):
+                open_tags.append((name, start, name_end, rest.end(1), pos))
+
+        # The template is never closed
+        return len(content), len(content)
+
+    def _close_tag(
+        self,
+        open_tags: List[Tuple[str, int, int, int, int]],
+        name: str,
+        children_end: int,
+        end: int,
+    ):
+        # Tags left open inside of it were never closed
+        for i in range(len(open_tags) - 1, -1, -1):
+            if open_tags[i][0] == name:
+                _, start, attributes_start, attributes_end, children_start = open_tags[
+                    i
+                ]
+                del open_tags[i:]
+                self._add_tag(
+                    name,
+                    start,
+                    end,
+                    attributes_start,
+                    attributes_end,
+                    children_start,
+                    children_end,
+                )
+                return
+
+    def _add_tag(
+        self,
+        name: str,
+        start: int,
+        end: int,
+        attributes_start: int,
+        attributes_end: int,
+        children_start: int = None,
+        children_end: int = None,
+    ):
+        attributes = self.content[attributes_start:attributes_end].strip()
+        children = (
+            self.content[children_start:children_end]
+            if children_start is not None
+            else ""
+        )
+        self.tags.append(
+            TeaTag(
+                tag=name,
+                props={m[0]: m[1] or True for m in PROP.findall(attributes)},
+                children=children.strip(),
+                attributes=attributes,
+                start=start,
+                end=end,
+                attributes_start=attributes_start,
+                attributes_end=attributes_end,
+            )
+        )
+
+    def script(self) -> SfcBlock | None:
+        """
+        The block imports go into, <script setup> if there is one
+        """
+        scripts = [block for block in self.blocks if block.tag == "script"]
+        return next(
+            (s for s in scripts if re.search(r"\bsetup\b", s.attributes)),
+            scripts[0] if scripts else None,
+        )
+
+    def import_edits(
+        self, add: Iterable[str] = (), remove: Iterable[str] = ()
+    ) -> List[Edit]:
+        """
+        Adds and removes import statements in one edit of the script, which is created if there is none
+        """
+        add, remove = list(add), list(remove)
+        script = self.script()
+        if script is None:
+            if not add:
+                return []
+            return [(0, 0, "\n<script setup>\n" + "\n".join(add) + "\n</script>\n")]
+
+        script_content = self.content[script.content_start : script.content_end]
+        new_script_content = script_content
+        for import_statement in add:
+            new_script_content = add_import(new_script_content, import_statement)
+        for import_statement in remove:
+            new_script_content = remove_import(new_script_content, import_statement)
+        if new_script_content == script_content:
+            return []
+        return [(script.content_start, script.content_end, new_script_content)]
+
+    def splice(self, edits: Iterable[Edit]) -> str:
+        """
+        Applies edits that don't overlap, in one copy of the content
+        """
+        pieces = []
+        pos = 0
+        for start, end, text in sorted(edits, key=lambda edit: edit[:2]):
+            pieces.append(self.content[pos:start])
+            pieces.append(text)
+            pos = end
+        pieces.append(self.content[pos:])
+        return "".join(pieces)
+
+
+def add_import(script_content: str, import_statement: str) -> str:
+    if import_statement in script_content:
+        return script_content
+
+    # Add the new import after the last existing import, or at the top without one
+    last_import = None
+    for last_import in IMPORT.finditer(script_content):
+        pass
+    if last_import:
+        return (
+            script_content[: last_import.end()]
+            + "\n"
+            + import_statement
+            + script_content[last_import.end() :]
+        )
+    return "\n" + import_statement + "\n" + script_content
+
+
+def remove_import(script_content: str, import_statement: str) -> str:
+    return re.sub(rf"{re.escape(import_statement)}\s*", "", script_content)
+
+
+def steep_id_edits(tea_tags: List[TeaTag]) -> List[Edit]:
+    """
+    Gives every <Tea> tag without one a steep id, so each tag keeps its own steep file between saves
+    """
+    used_ids = set()
+    unstamped = []
+    for tea_tag in tea_tags:
+        steep_id = get_steep_id(tea_tag)
+        # Copied tags carry the id of the original, so they need a new one too
+        if steep_id is None or steep_id in used_ids:
+            unstamped.append(tea_tag)
+        else:
+            used_ids.add(steep_id)
+
+    edits = []
+    next_id = 1
+    for tea_tag in unstamped:
+        while str(next_id) in used_ids:
+            next_id += 1
+        used_ids.add(str(next_id))
+
+        attributes = re.sub(
+            rf"\s*(?<![\w-]){STEEP_ID_PROP}(?:=[\"'][^\"']*[\"'])?(?![\w-])",
+            "",
+            tea_tag.attributes,
+        ).strip()
+        opening_tag = f'<{tea_tag.tag} {STEEP_ID_PROP}="{next_id}"'
+        if attributes:
+            opening_tag += " " + attributes
+        edits.append((tea_tag.start, tea_tag.attributes_end, opening_tag))
+    return edits
+
+
+def find_poured_tag(sfc: Sfc, component_name: str) -> TeaTag | None:
+    return next(
+        (t for t in sfc.tags if t.props.get("pour", None) == component_name), None
+    )
+
+
+def pour_edit(sfc: Sfc, tea_tag: TeaTag, component_name: str) -> Edit:
+    """
+    Replaces the tag being poured with the newly created component, keeping its other attributes
+    """
+    attributes = sfc.content[tea_tag.attributes_start : tea_tag.attributes_end]
+    new_attributes = re.sub(
+        rf"\s*(pour=[\"']{component_name}[\"']|{STEEP_ID_PROP}=[\"'][^\"']*[\"'])",
+        "",
+        attributes,
+    ).rstrip()
+    return (
+        tea_tag.start,
+        tea_tag.end,
+        f"<{component_name}{new_attributes}></{component_name}>",
+    )
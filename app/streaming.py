@@ -0,0 +1,215 @@
+import re
+import time
+
+import json5
+from component_creation import PARTIAL_STEEP_MARKER, create_steep_component
+from file_sync import sync_file
+from helpers import log
+
+# Top-level SFC blocks, a template can hold nested <template> tags for slots
+SFC_BLOCK_TAG = re.compile(r"<(/?)(script|template|style)\b[^>]*>")
+
+
+def get_fenced_code(response: str) -> str | None:
+    """
+    Gets the code inside the first code fence of a response, which may still be streaming
+    """
+    start = response.find("```")
+    if start == -1:
+        return None
+    # Skip the language of the fence, e.g. ```vue
+    line_end = response.find("\n", start)
+    if line_end == -1:
+        return None
+    code = response[line_end + 1 :]
+    end = code.find("```")
+    return code if end == -1 else code[:end]
+
+
+class FenceDetector:
+    """
+    Notices when the first code fence of a streaming response closes, without rescanning what it already saw
+    """
+
+    def __init__(self):
+        self._code_start = None
+        self._searched = 0
+
+    def feed(self, response: str) -> bool:
+        if self._code_start is None:
+            start = response.find("```")
+            line_end = response.find("\n", start) if start != -1 else -1
+            if line_end == -1:
+                return False
+            self._code_start = self._searched = line_end + 1
+
+        # Back up a little in case the fence was split across chunks
+        self._searched = max(self._code_start, self._searched - 2)
+        closed = response.find("```", self._searched) != -1
+        self._searched = len(response)
+        return closed
+
+
+class JsonObjectDetector:
+    """
+    Notices when the first top-level JSON object of a streaming response closes, without rescanning what it already saw.
+    Anything before the object, like a code fence, is skipped.
+    """
+
+    CLOSERS = {"{": "}", "[": "]"}
+
+    def __init__(self):
+        self.start: int | None = None
+        self.end: int | None = None
+        # The objects and arrays that are open and whether the scan is inside a string
+        self.open: list[str] = []
+        self.quote: str | None = None
+        self._escaped = False
+        self._scanned = 0
+
+    def feed(self, response: str) -> bool:
+        if self.end is not None:
+            return True
+        for i in range(self._scanned, len(response)):
+            char = response[i]
+            if self.start is None:
+                if char == "{":
+                    self.start = i
+                    self.open.append(char)
+            elif self.quote:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == self.quote:
+                    self.quote = None
+            elif char in "\"'":
+                self.quote = char
+            elif char in self.CLOSERS:
+                self.open.append(char)
+            elif self.open and char == self.CLOSERS[self.open[-1]]:
+                self.open.pop()
+                if not self.open:
+                    self.end = i + 1
+                    return True
+        self._scanned = len(response)
+        return False
+
+
+def parse_json_object(response: str) -> dict:
+    """
+    Parses the first JSON object of a response and repairs what models commonly get wrong locally,
+    instead of generating the response again: chatter or a code fence around it, single quotes,
+    unquoted keys, comments, trailing commas and an object that was cut off.
+    """
+    detector = JsonObjectDetector()
+    if detector.feed(response):
+        return json5.loads(response[detector.start : detector.end])
+    if detector.start is None:
+        raise ValueError(f"No JSON object in the response: {response}")
+
+    # Close whatever was still open when the response ended
+    text = response[detector.start :].rstrip()
+    if detector.quote:
+        text += detector.quote
+    text = text.rstrip(",")
+    for opener in reversed(detector.open):
+        text += JsonObjectDetector.CLOSERS[opener]
+    return json5.loads(text)
+
+
+def scan_blocks(code: str) -> tuple[str | None, int | None, bool]:
+    """
+    Walks the top-level blocks of the code.
+    Returns the block it ends inside of, where the last closed block ends and whether a template was closed.
+    """
+    depth = 0
+    open_tag = None
+    closed_end = None
+    has_template = False
+
+    for match in SFC_BLOCK_TAG.finditer(code):
+        closing, tag = match.group(1) == "/", match.group(2)
+        if open_tag is None:
+            if not closing:
+                open_tag, depth = tag, 1
+            continue
+        # Only templates nest, script and style contents are not markup
+        if tag != open_tag or (open_tag != "template" and not closing):
+            continue
+        depth += -1 if closing else 1
+        if depth == 0:
+            has_template = has_template or open_tag == "template"
+            open_tag = None
+            closed_end = match.end()
+
+    return open_tag, closed_end, has_template
+
+
+def close_open_block(code: str) -> str:
+    """
+    Closes the last top-level block if the code ends inside of it.
+    Stop sequences end the response right before the closing tag of the last block.
+    """
+    open_tag, _, _ = scan_blocks(code)
+    if open_tag is None:
+        return code
+    return code.rstrip("\n") + f"\n</{open_tag}>\n"
+
+
+def get_closed_blocks(code: str) -> str | None:
+    """
+    Cuts the code after its last closed top-level block, or returns None until a template is closed.
+    Anything written before that would not render anything useful.
+    """
+    _, closed_end, has_template = scan_blocks(code)
+    if closed_end is None or not has_template:
+        return None
+    return code[:closed_end] + "\n"
+
+
+class SteepStreamWriter:
+    """
+    Writes the component into its steep file while it is being generated, so the browser can show progress.
+    Only closed top-level blocks are written, and at most once per interval.
+    They are marked as partial, so a stream that stops halfway is never taken for a steeped component.
+    """
+
+    def __init__(self, steep_path: str, previous: str = "", interval: float = 0.5):
+        self.steep_path = steep_path
+        # What the steep file showed before, the component being replaced or the placeholder
+        self.previous = previous or create_steep_component()
+        self.interval = interval
+        self._last_write = 0.0
+        self._last_content = None
+
+    def feed(self, response: str):
+        now = time.monotonic()
+        if now - self._last_write < self.interval:
+            return
+
+        code = get_fenced_code(response)
+        partial = get_closed_blocks(code) if code else None
+        if partial is None or partial == self._last_content:
+            return
+
+        sync_file(self.steep_path, PARTIAL_STEEP_MARKER + partial)
+        log.debug(f"Wrote {len(partial)} characters of the component so far")
+        self._last_write = now
+        self._last_content = partial
+
+    def discard(self):
+        """
+        Puts back what the steep file showed before, when the stream didn't end in a whole component.
+        A file something else wrote to meanwhile, like a newer generation, is left alone.
+        """
+        if self._last_content is None:
+            return
+        try:
+            with open(self.steep_path, "r") as steep_file:
+                if steep_file.read() != PARTIAL_STEEP_MARKER + self._last_content:
+                    return
+        except FileNotFoundError:
+            return
+        sync_file(self.steep_path, self.previous)
+        self._last_content = None
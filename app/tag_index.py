@@ -0,0 +1,94 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, Iterable, List
+
+from helpers import TeaTag, log
+from sfc import Sfc
+
+
+def read_tags(file_path: str) -> List[TeaTag]:
+    try:
+        with open(file_path, "r") as file:
+            content = file.read()
+    except (OSError, UnicodeDecodeError) as e:
+        log.debug(f"Can't read {file_path}: {e}")
+        return []
+    # Most files have no tag, which is much cheaper to find out than parsing them
+    if "<Tea" not in content:
+        return []
+    return Sfc(content).tags
+
+
+class TagIndex:
+    """
+    Knows the <Tea> tags of every watched file, filled by scanning the project when Tea starts
+    and kept current as files are processed, deleted or moved.
+    Also counts the files with tags in every folder, which share the folder's cup.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._tags: Dict[str, List[TeaTag]] = {}
+        self._folders: Counter[str] = Counter()
+
+    def set_tags(self, file_path: str, tea_tags: List[TeaTag]):
+        with self._lock:
+            had_tags = file_path in self._tags
+            if tea_tags:
+                self._tags[file_path] = tea_tags
+                if not had_tags:
+                    self._folders[os.path.dirname(file_path)] += 1
+            elif had_tags:
+                del self._tags[file_path]
+                self._forget_folder(os.path.dirname(file_path))
+
+    def remove(self, path: str):
+        """
+        Forgets a deleted or moved file, or every file in a directory
+        """
+        prefix = os.path.join(path, "")
+        with self._lock:
+            for file_path in [
+                p for p in self._tags if p == path or p.startswith(prefix)
+            ]:
+                del self._tags[file_path]
+                self._forget_folder(os.path.dirname(file_path))
+
+    def _forget_folder(self, folder: str):
+        self._folders[folder] -= 1
+        if self._folders[folder] <= 0:
+            del self._folders[folder]
+
+    def tags(self, file_path: str) -> List[TeaTag]:
+        with self._lock:
+            return self._tags.get(file_path, [])
+
+    def files_with_tags(self) -> List[str]:
+        with self._lock:
+            return list(self._tags)
+
+    def folder_has_tags(self, folder: str) -> bool:
+        with self._lock:
+            return folder in self._folders
+
+    def scan(self, file_paths: Iterable[str], max_workers: int = 4):
+        """
+        Reads the tags of all files, several at a time
+        """
+        started = time.perf_counter()
+        file_paths = list(file_paths)
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="tea-scan"
+        ) as pool:
+            for file_path, tea_tags in zip(file_paths, pool.map(read_tags, file_paths)):
+                self.set_tags(file_path, tea_tags)
+
+        with self._lock:
+            tag_count = sum(len(tea_tags) for tea_tags in self._tags.values())
+            file_count = len(self._tags)
+        log.info(
+            f"Found {tag_count} <Tea> tag(s) in {file_count} of {len(file_paths)} files in {time.perf_counter() - started:.2f}s"
+        )
@@ -0,0 +1,37 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from helpers import log, timed_import
+
+if TYPE_CHECKING:
+    import tiktoken
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> "tiktoken.Encoding | None":
+    """
+    Gets the tokenizer of a model once. Models tiktoken doesn't know are measured with cl100k_base,
+    which is close enough to budget a prompt.
+    """
+    try:
+        with timed_import("tokenizer"):
+            import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # e.g. the encoding can't be downloaded
+        log.warning(f"No tokenizer available, estimating token counts instead: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    if not text:
+        return 0
+    encoding = get_encoding(model)
+    if encoding is None:
+        # Roughly four characters per token for code and English
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
@@ -1,23 +1,161 @@
 import fnmatch
+import os
 import pathlib
+import re
+from functools import lru_cache
 from itertools import islice
 from threading import Thread
+from typing import Dict, Iterator, List, Tuple
 
 import igittigitt
-from helpers import log
+from component_index import ComponentIndex
+from helpers import CUP_PATTERNS, log
+from jobs import JobQueue
+from model_keeper import ModelKeeper
+from project_index import ProjectIndex
+from tag_index import TagIndex
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
+from watchdog.observers.api import ObservedWatch
+
+# inotify allows 128 instances per user by default and editors need some too
+MAX_WATCHES = 64
+
+
+def compile_patterns(patterns: List[str], strip_slash=False) -> re.Pattern | None:
+    """
+    Compiles fnmatch patterns into a single regex matching any of them
+    """
+    patterns = [p.rstrip("/") if strip_slash else p for p in patterns if p]
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(p)})" for p in patterns))
+
+
+class PathMatcher:
+    """
+    Decides whether a path is ignored. A path is ignored when .gitignore or an ignore pattern matches it,
+    or when there are watch patterns and none of them match it.
+    Patterns match either the whole path relative to the root or any single part of it.
+
+    All patterns are compiled once, and what the directories of a path and .gitignore decide is cached.
+    """
+
+    def __init__(
+        self,
+        base_path: str,
+        ignore_patterns: List[str],
+        watch_patterns: List[str] = None,
+        gitignore: igittigitt.IgnoreParser = None,
+        cache_size: int = 4096,
+    ):
+        self.base_path = base_path
+        self._prefix = os.path.join(base_path, "")
+        self.gitignore = gitignore
+        self.ignore_path = compile_patterns(ignore_patterns)
+        self.ignore_part = compile_patterns(ignore_patterns, strip_slash=True)
+        self.watch_path = compile_patterns(watch_patterns or [])
+        self.watch_part = compile_patterns(watch_patterns or [], strip_slash=True)
+        self.is_ignored_directory = lru_cache(maxsize=cache_size)(
+            self._is_ignored_directory
+        )
+        self._is_watched_directory = lru_cache(maxsize=cache_size)(
+            self._is_watched_directory
+        )
+        # Matching .gitignore goes through every rule, and editors save the same few files over and over
+        self._is_gitignored = lru_cache(maxsize=cache_size)(self._is_gitignored)
+
+    def _is_ignored_directory(self, relative_directory: str) -> bool:
+        """
+        Whether everything inside the directory (relative to the root) is ignored
+        """
+        if not relative_directory:
+            return False
+        parent, name = os.path.split(relative_directory)
+        if self.is_ignored_directory(parent):
+            return True
+        if self.ignore_part and self.ignore_part.match(name):
+            return True
+        # Patterns like .git/* match everything below the directory
+        if self.ignore_path and self.ignore_path.match(relative_directory + "/"):
+            return True
+        return bool(
+            self.gitignore
+            and self.gitignore.match(pathlib.Path(self.base_path, relative_directory))
+        )
+
+    def _is_watched_directory(self, relative_directory: str) -> bool:
+        """
+        Whether a part of the directory matches a watch pattern, which watches everything inside it
+        """
+        if not relative_directory:
+            return False
+        parent, name = os.path.split(relative_directory)
+        return self._is_watched_directory(parent) or bool(self.watch_part.match(name))
+
+    def _is_gitignored(self, path: str) -> bool:
+        return bool(self.gitignore and self.gitignore.match(pathlib.Path(path)))
+
+    def is_ignored(self, path: str) -> bool:
+        if path.startswith(self._prefix):
+            relative_path = path[len(self._prefix) :]
+        else:
+            relative_path = os.path.relpath(path, self.base_path)
+        relative_directory, name = os.path.split(relative_path)
+
+        if self.is_ignored_directory(relative_directory):
+            return True
+        if self.ignore_part and self.ignore_part.match(name):
+            return True
+        if self.ignore_path and self.ignore_path.match(relative_path):
+            return True
+
+        # Check if any watch patterns are matched, this is cheaper than .gitignore so it goes first
+        if self.watch_part and not (
+            self.watch_part.match(name)
+            or self.watch_path.match(relative_path)
+            or self._is_watched_directory(relative_directory)
+        ):
+            return True
+
+        return self._is_gitignored(path)
 
 
 class FileWatcher:
-    def __init__(self, root_directory, watch_patterns=None, ignore_patterns=None):
-        self.base_path = root_directory
+    """
+    Watches every directory with nothing ignored below it with one recursive watch, and the directories above
+    an ignored tree each on their own. Every watch is an inotify instance and a user only gets 128 of them,
+    so a directory only gets its own watch when it has to.
+    Ignored trees like node_modules or .git are never watched or walked, at any depth,
+    and watches follow directories as they are created or deleted.
+    """
+
+    def __init__(
+        self,
+        root_directory,
+        jobs: JobQueue,
+        watch_patterns=None,
+        ignore_patterns=None,
+        project_index: ProjectIndex = None,
+        tag_index: TagIndex = None,
+        component_index: ComponentIndex = None,
+        model_keeper: ModelKeeper = None,
+    ):
+        self.base_path = os.path.abspath(root_directory)
+        self.jobs = jobs
+        self.project_index = project_index
+        self.tag_index = tag_index
+        self.component_index = component_index
+        self.model_keeper = model_keeper
         log.info("Watching directory:")
         display_content(self.base_path)
         self.watch_patterns = watch_patterns
-        self.ignore_patterns = ignore_patterns + [".git/*"]
-        if ignore_patterns:
-            self.ignore_patterns.extend(ignore_patterns)
+        # Tea writes the steeps into the cup of a file itself, and every file through a temp file
+        self.ignore_patterns = (ignore_patterns or []) + [
+            ".git/*",
+            *CUP_PATTERNS,
+            ".tea-*.tmp",
+        ]
 
         gitignore_path = pathlib.Path(self.base_path) / ".gitignore"
         if gitignore_path.exists():
@@ -31,51 +169,200 @@ class FileWatcher:
         else:
             log.info(f"Ignore patterns:{self.ignore_patterns}")
 
+        self.matcher = PathMatcher(
+            base_path=self.base_path,
+            ignore_patterns=self.ignore_patterns,
+            watch_patterns=self.watch_patterns,
+            gitignore=self.gitignore,
+        )
+
         self.observer = Observer()
+        self.watches: Dict[str, ObservedWatch] = {}
         self.event_handler = FileSystemEventHandler()
+        self.event_handler.on_any_event = self._on_any_event
+        self.event_handler.on_created = self._on_created
         self.event_handler.on_modified = self._on_modified
+        self.event_handler.on_moved = self._on_moved
         self.thread = Thread(target=self._watch)
-        self.last_modified_file = None
-        self.last_modified_file_inc = 0
 
     def _is_ignored(self, path):
-        relative_path = pathlib.Path(path).relative_to(self.base_path)
+        return self.matcher.is_ignored(path)
 
-        if self.gitignore and self.gitignore.match(pathlib.Path(path)):
-            return True
+    def _is_ignored_directory(self, path) -> bool:
+        if self.project_index and path in self.project_index.watched_directories():
+            return False
+        relative_path = os.path.relpath(path, self.base_path)
+        return self.matcher.is_ignored_directory(
+            "" if relative_path == "." else relative_path
+        )
 
-        for pattern in self.ignore_patterns:
-            # Check the full path for a match
-            if fnmatch.fnmatch(str(relative_path), pattern):
-                return True
-            # Check each part of the path for a match
-            for part in relative_path.parts:
-                if fnmatch.fnmatch(part, pattern.rstrip("/")):
-                    return True
+    def _walk(self, directory: str):
+        for path, directories, files in os.walk(directory):
+            # Pruning here keeps os.walk from ever descending into ignored trees
+            directories[:] = [
+                d
+                for d in directories
+                if not self._is_ignored_directory(os.path.join(path, d))
+            ]
+            yield path, files
 
-        # Check if any watch patterns are matched:
-        if self.watch_patterns:
-            for pattern in self.watch_patterns:
-                # Check the full path for a match
-                if fnmatch.fnmatch(str(relative_path), pattern):
-                    return False
-                # Check each part of the path for a match
-                for part in relative_path.parts:
-                    if fnmatch.fnmatch(part, pattern.rstrip("/")):
-                        return False
-            return True
+    def watched_files(self) -> Iterator[str]:
+        """
+        Every file under the root that a save of would be processed
+        """
+        for path, files in self._walk(self.base_path):
+            for name in files:
+                file_path = os.path.join(path, name)
+                if not self._is_ignored(file_path):
+                    yield file_path
+
+    def _recursive_watch_of(self, path: str) -> str | None:
+        """
+        The directory of the recursive watch that already covers a path below it, if any
+        """
+        return next(
+            (
+                watched
+                for watched, watch in self.watches.items()
+                if watch.is_recursive and path.startswith(os.path.join(watched, ""))
+            ),
+            None,
+        )
 
-        return False
+    def _watch_layout(self, directory: str) -> List[Tuple[str, bool]]:
+        """
+        The watches that cover the directory without taking in an ignored tree, as (path, recursive).
+        A directory with an ignored tree somewhere below it is watched on its own,
+        the directories below it with nothing ignored are watched recursively.
+        """
+        order = []
+        split = set()
+        for path, directories, _ in os.walk(directory):
+            kept = [
+                d
+                for d in directories
+                if not self._is_ignored_directory(os.path.join(path, d))
+            ]
+            if len(kept) < len(directories):
+                # Every directory up from here would take in the ignored one
+                parent = path
+                while parent not in split:
+                    split.add(parent)
+                    if parent == directory:
+                        break
+                    parent = os.path.dirname(parent)
+            directories[:] = kept
+            order.append(path)
+        return [
+            (path, path not in split)
+            for path in order
+            if path in split or path == directory or os.path.dirname(path) in split
+        ]
+
+    def _schedule(self, path: str, recursive: bool):
+        if path in self.watches or self._recursive_watch_of(path):
+            return
+        try:
+            self.watches[path] = self.observer.schedule(
+                self.event_handler, path, recursive=recursive
+            )
+        except OSError as e:
+            log.warning(f"Can't watch {path}: {e}")
+
+    def _schedule_tree(self, directory: str):
+        """
+        Watches the directory and everything below it that isn't ignored, as far as the watches go
+        """
+        skipped = []
+        # Parents come first, so what is left out is deep down
+        for path, recursive in self._watch_layout(directory):
+            if len(self.watches) >= MAX_WATCHES:
+                skipped.append(path)
+            else:
+                self._schedule(path, recursive)
+        if skipped:
+            log.warning(
+                f"Not watching {len(skipped)} directories under {directory} like {skipped[0]}, "
+                f"watching more would take more than {MAX_WATCHES} inotify instances"
+            )
+
+    def _directory_added(self, path: str):
+        covering = self._recursive_watch_of(path)
+        if covering is None:
+            if not self._is_ignored_directory(path):
+                self._schedule_tree(path)
+            return
+        # The recursive watch took in an ignored tree, e.g. one an install just created, so it is split around it
+        if self._is_ignored_directory(path) or self._watch_layout(path) != [
+            (path, True)
+        ]:
+            self._unschedule_tree(covering)
+            self._schedule_tree(covering)
+
+    def _unschedule_tree(self, directory: str):
+        prefix = os.path.join(directory, "")
+        for path in [p for p in self.watches if p == directory or p.startswith(prefix)]:
+            watch = self.watches.pop(path)
+            try:
+                self.observer.unschedule(watch)
+            except (KeyError, OSError):
+                # The watch went away with the directory
+                pass
+
+    def _on_any_event(self, event):
+        # Keep the watches in step with the directories
+        if event.is_directory and event.event_type in ("moved", "deleted"):
+            self._unschedule_tree(event.src_path)
+        if event.is_directory and event.event_type in ("created", "moved"):
+            self._directory_added(
+                event.dest_path if event.event_type == "moved" else event.src_path
+            )
+
+        # The project index also reads files we otherwise ignore, like package.json or .nuxt/components.d.ts
+        if self.project_index:
+            structural = event.event_type in ("created", "deleted", "moved")
+            self.project_index.invalidate(event.src_path, structural=structural)
+            if event.event_type == "moved":
+                self.project_index.invalidate(event.dest_path, structural=True)
+
+        # A moved file is processed again under its new path
+        if event.event_type in ("deleted", "moved"):
+            if self.tag_index:
+                self.tag_index.remove(event.src_path)
+            if self.component_index:
+                self.component_index.remove(event.src_path)
+            if self.model_keeper:
+                self.model_keeper.remove(event.src_path)
 
     def _on_modified(self, event):
-        if not self._is_ignored(event.src_path):
+        # A directory is modified whenever a file in it is created
+        if not event.is_directory and not self._is_ignored(event.src_path):
             log.info(f"Modified: {event.src_path}")
-            self.last_modified_file = event.src_path
-            self.last_modified_file_inc += 1
+            self.jobs.put(event.src_path)
+
+    def _on_created(self, event):
+        # A file written right after its directory was created can be in it before the recursive watch is,
+        # then the watch only reports that the file was created
+        self._on_modified(event)
+
+    def _on_moved(self, event):
+        # Editors that save through a temp file, and Tea itself, move the new version into place
+        if not event.is_directory and not self._is_ignored(event.dest_path):
+            log.info(f"Moved: {event.dest_path}")
+            self.jobs.put(event.dest_path)
 
     def _watch(self):
-        self.observer.schedule(self.event_handler, self.base_path, recursive=True)
-        self.observer.start()
+        self._schedule_tree(self.base_path)
+        if self.project_index:
+            for directory in self.project_index.watched_directories():
+                if os.path.isdir(directory):
+                    self._schedule_tree(directory)
+        log.info(f"Watching the project with {len(self.watches)} watches")
+        try:
+            self.observer.start()
+        except OSError as e:
+            log.error(f"Can't start watching {self.base_path}: {e}")
+            return
         self.observer.join()
 
     def start(self):
@@ -0,0 +1,466 @@
+"""
+Microbenchmarks for everything Tea does around the model: parsing, watching and rewriting files.
+
+Generates a synthetic Vue project, times the hot paths on it and prints how long a call takes.
+Results can be saved as JSON and compared against an earlier run to catch regressions:
+
+    python benchmarks/bench_pipeline.py --files 500 --sfc-lines 800 --json before.json
+    python benchmarks/bench_pipeline.py --files 500 --sfc-lines 800 --compare before.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+)
+
+from component_index import ComponentIndex  # noqa: E402
+from context_packer import pack_context  # noqa: E402
+from fingerprints import FingerprintIndex  # noqa: E402
+from generations import GenerationRegistry  # noqa: E402
+from helpers import (  # noqa: E402
+    CONFIG_DEFAULTS,
+    EnvConfig,
+    get_available_components,
+    get_tea_import_statement,
+    log,
+)
+from jobs import JobQueue  # noqa: E402
+from langchain_community.llms.fake import FakeStreamingListLLM  # noqa: E402
+from main import Main  # noqa: E402
+from project_index import ProjectIndex  # noqa: E402
+from sfc import Sfc, find_poured_tag, pour_edit, steep_id_edits  # noqa: E402
+from tag_index import TagIndex  # noqa: E402
+from watchdog.events import FileModifiedEvent  # noqa: E402
+from watcher import FileWatcher  # noqa: E402
+
+FAKE_RESPONSE = """Here is the component:
+```vue
+<script setup lang="ts">
+import { ref } from 'vue'
+const count = ref(0)
+</script>
+
+<template>
+    <button class="counter" @click="count++">Clicked {{ count }} times</button>
+</template>
+
+<style scoped>
+.counter {
+    padding: 0.5rem 1rem;
+}
+</style>
+```
+"""
+
+
+def make_sfc(lines: int, tags: int, imports: int = 8) -> str:
+    """
+    Makes a single file component with roughly the given number of lines and <Tea> tags spread over its template
+    """
+    script = [f"import Comp{i} from '~/components/Comp{i}.vue'" for i in range(imports)]
+    script += [
+        "import { ref, computed } from 'vue'",
+        "import { useMouse } from '@vueuse/core'",
+        "const props = defineProps({",
+        "    title: { type: String, required: true },",
+        "    items: { type: Array, default: () => [] },",
+        "})",
+        "const open = ref(false)",
+        "const count = computed(() => props.items.length)",
+    ]
+    style_lines = max(lines // 5, 1)
+    template_lines = max(lines - len(script) - style_lines - 6, tags)
+    every = max(template_lines // (tags + 1), 1)
+
+    template = []
+    placed = 0
+    for i in range(template_lines):
+        if placed < tags and i and i % every == 0:
+            template.append(
+                f'        <Tea :title="title">make card number {placed}</Tea>'
+            )
+            placed += 1
+        else:
+            template.append(
+                f'        <div class="row row-{i}">{{{{ title }}}} row {i}</div>'
+            )
+    style = [f".row-{i} {{ margin: {i % 16}px; }}" for i in range(style_lines)]
+
+    return "\n".join(
+        [
+            '<script setup lang="ts">',
+            *script,
+            "</script>",
+            "",
+            "<template>",
+            "    <div>",
+        ]
+        + template
+        + ["    </div>", "</template>", "", "<style scoped>", *style, "</style>", ""]
+    )
+
+
+def make_project(root: str, files: int, sfc_lines: int, tags: int, components: int):
+    """
+    Writes a Nuxt-like project with the pages, components and the usual ignored trees
+    """
+
+    def write(path: str, content: str):
+        path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            file.write(content)
+
+    write(
+        "package.json",
+        json.dumps(
+            {
+                "dependencies": {f"pkg{i}": "^1.0.0" for i in range(30)}
+                | {"vue": "^3.4.0", "@vueuse/core": "^10.7.0"},
+                "devDependencies": {f"dev-pkg{i}": "^1.0.0" for i in range(30)},
+            }
+        ),
+    )
+    write(
+        "tsconfig.json",
+        json.dumps({"compilerOptions": {"paths": {"~/*": ["./*"], "@/*": ["./*"]}}}),
+    )
+    write(".gitignore", "node_modules\n.nuxt\ndist\n")
+    write(
+        ".nuxt/components.d.ts",
+        "\n".join(
+            [
+                f"export const Comp{i}: typeof import(\"../components/Comp{i}.vue\")['default']"
+                for i in range(components)
+            ]
+            + [
+                f"export const LazyComp{i}: typeof import(\"../components/Comp{i}.vue\")['default']"
+                for i in range(components)
+            ]
+        ),
+    )
+    for i in range(files):
+        write(f"pages/section{i % 20}/Page{i}.vue", make_sfc(sfc_lines, tags))
+    for i in range(min(components, 200)):
+        write(f"components/Comp{i}.vue", make_sfc(40, 0, imports=0))
+    for i in range(50):
+        write(f"node_modules/pkg{i}/index.js", "module.exports = {}\n")
+        write(f".git/objects/{i:02x}/{i:038x}", "")
+        write(f"dist/chunk{i}.js", "")
+
+
+def make_event_storm(root: str, files: int, events: int) -> List[str]:
+    """
+    Paths of a burst of file events, like a branch switch or an install, mostly outside what Tea watches
+    """
+    rng = random.Random(0)
+    paths = []
+    for _ in range(events):
+        roll = rng.random()
+        if roll < 0.4:
+            i = rng.randrange(files)
+            paths.append(os.path.join(root, f"pages/section{i % 20}/Page{i}.vue"))
+        elif roll < 0.7:
+            paths.append(
+                os.path.join(
+                    root, f"node_modules/pkg{rng.randrange(500)}/dist/index.js"
+                )
+            )
+        elif roll < 0.85:
+            paths.append(
+                os.path.join(root, f".git/objects/{rng.randrange(256):02x}/obj")
+            )
+        elif roll < 0.95:
+            paths.append(
+                os.path.join(
+                    root, f"pages/section{rng.randrange(20)}/cup/Page/Steep1.vue"
+                )
+            )
+        else:
+            paths.append(
+                os.path.join(root, f".nuxt/dist/chunk{rng.randrange(100)}.mjs")
+            )
+    return paths
+
+
+class InlinePool:
+    """
+    Runs the steeps right away, so a process_file call includes them
+    """
+
+    def submit(self, fn: Callable, *args):
+        fn(*args)
+
+
+def measure(
+    fn: Callable[[], object],
+    setup: Callable[[], object] = None,
+    repeat: int = 5,
+    min_time: float = 0.1,
+) -> Dict[str, float]:
+    """
+    Times fn and returns the fastest and median time per call in microseconds.
+    Without a setup, fn is called in a loop long enough to be measured. With one, setup runs untimed before every call.
+    """
+    number = 1
+    if setup is None:
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            if time.perf_counter() - start >= min_time:
+                break
+            number *= 2
+
+    timings = []
+    for _ in range(repeat):
+        elapsed = 0.0
+        for _ in range(number):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            fn()
+            elapsed += time.perf_counter() - start
+        timings.append(elapsed / number * 1e6)
+    return {"min_us": min(timings), "median_us": statistics.median(timings)}
+
+
+def run(args) -> Dict[str, Dict[str, float]]:
+    root = tempfile.mkdtemp(prefix="tea-bench-")
+    make_project(root, args.files, args.sfc_lines, args.tags, args.components)
+    page_path = os.path.join(root, "pages/section0/Page0.vue")
+    with open(page_path, "r") as file:
+        page = file.read()
+
+    # Every rewrite is spliced into a parse of the file, the way process_file does it
+    page_sfc = Sfc(page)
+    tea_tags = page_sfc.tags
+    stamped_sfc = Sfc(page_sfc.splice(steep_id_edits(tea_tags)))
+    stamped, stamped_tags = stamped_sfc.content, stamped_sfc.tags
+    import_statement = get_tea_import_statement(page_path)
+    with_import_sfc = Sfc(
+        stamped_sfc.splice(stamped_sfc.import_edits(add=[import_statement]))
+    )
+    # Pour the tag in the middle of the template
+    middle = stamped_tags[len(stamped_tags) // 2]
+    pouring = stamped[: middle.start] + stamped[middle.start :].replace(
+        "<Tea ", '<Tea pour="NewCard" ', 1
+    )
+    # A tag that is still being typed, so it has no closing tag yet
+    typing = page.replace("<template>", "<template>\n<Tea>a card with", 1)
+    project_index = ProjectIndex(root)
+    storm = make_event_storm(root, args.files, args.events)
+
+    results = {}
+
+    def bench(name: str, fn: Callable[[], object], **kwargs):
+        results[name] = measure(fn, repeat=args.repeat, **kwargs)
+        print(
+            f"{name:<40} {results[name]['min_us']:>12.1f} µs {results[name]['median_us']:>12.1f} µs",
+            flush=True,
+        )
+
+    print(f"{'':<40} {'fastest':>15} {'median':>15}")
+
+    def pour():
+        # The file is parsed again when it is poured, it changed while the tag was steeping
+        sfc = Sfc(pouring)
+        tea_tag = find_poured_tag(sfc, "NewCard")
+        return sfc.splice([pour_edit(sfc, tea_tag, "NewCard")])
+
+    bench("Sfc.tags", lambda: Sfc(page).tags)
+    bench("Sfc.tags (unclosed tag)", lambda: Sfc(typing).tags)
+    bench(
+        "steep_id_edits + splice",
+        lambda: page_sfc.splice(steep_id_edits(tea_tags)),
+    )
+    bench(
+        "import_edits (add) + splice",
+        lambda: stamped_sfc.splice(stamped_sfc.import_edits(add=[import_statement])),
+    )
+    bench(
+        "import_edits (remove) + splice",
+        lambda: with_import_sfc.splice(
+            with_import_sfc.import_edits(remove=[import_statement])
+        ),
+    )
+    bench("find_poured_tag + pour_edit + splice", pour)
+    bench(
+        "get_available_components",
+        lambda: get_available_components(root),
+    )
+    bench("ProjectIndex.available_components", project_index.available_components)
+    bench(
+        "pack_context",
+        lambda: pack_context(
+            stamped,
+            stamped_tags[0],
+            project_index.packages(),
+            budget=int(CONFIG_DEFAULTS["PROMPT_TOKEN_BUDGET"]) // 2,
+            model="gpt-3.5-turbo",
+        ),
+    )
+
+    watcher = FileWatcher(
+        root_directory=root,
+        jobs=JobQueue(),
+        watch_patterns=CONFIG_DEFAULTS["PATTERNS"].split(","),
+        ignore_patterns=CONFIG_DEFAULTS["IGNORE_PATTERNS"].split(","),
+        project_index=project_index,
+    )
+    events = [FileModifiedEvent(path) for path in storm]
+
+    def is_ignored_storm():
+        for path in storm:
+            watcher._is_ignored(path)
+
+    def on_modified_storm():
+        watcher.jobs = JobQueue()
+        for event in events:
+            watcher._on_modified(event)
+
+    bench(f"FileWatcher._is_ignored x{len(storm)}", is_ignored_storm)
+    bench(f"FileWatcher._on_modified x{len(events)}", on_modified_storm)
+
+    watched_files = list(watcher.watched_files())
+    bench(
+        f"TagIndex.scan x{len(watched_files)}",
+        lambda: TagIndex().scan(watched_files),
+    )
+    component_index = ComponentIndex()
+    component_index.scan(watched_files)
+    bench(
+        f"ComponentIndex.scan x{len(watched_files)}",
+        lambda: ComponentIndex().scan(watched_files),
+    )
+    bench(
+        f"ComponentIndex.search ({len(component_index)} components)",
+        lambda: component_index.search(
+            "a card with the user name, a save button and a list of items", 5
+        ),
+    )
+
+    config = EnvConfig(
+        patterns=CONFIG_DEFAULTS["PATTERNS"].split(","),
+        root_directory=root,
+        ignore_patterns=CONFIG_DEFAULTS["IGNORE_PATTERNS"].split(","),
+        model="fake",
+        temperature=0.0,
+        base_url="",
+        log_level="ERROR",
+        openai_key=None,
+        workers=1,
+        llm_concurrency=1,
+        cache_directory="",
+        cache_max_mb=0,
+        prompt_token_budget=int(CONFIG_DEFAULTS["PROMPT_TOKEN_BUDGET"]),
+        metrics_directory="",
+        # The steeps run inline, see InlinePool
+        async_llm=False,
+        keep_alive_minutes=0,
+        idle_minutes=0,
+        # The fake model answers with whole components, every round steeps them whole
+        refine_steeps=False,
+        related_components=int(CONFIG_DEFAULTS["RELATED_COMPONENTS"]),
+    )
+    main = Main(llm=FakeStreamingListLLM(responses=[FAKE_RESPONSE]), config=config)
+    main.steep_pool = InlinePool()
+
+    def reset_page():
+        # Start every round from an unprocessed page
+        with open(page_path, "w") as file:
+            file.write(page)
+        main.fingerprints = FingerprintIndex()
+        main.generations = GenerationRegistry()
+
+    def process_file():
+        main.process_file(page_path, root_directory=root)
+
+    bench(
+        f"Main.process_file ({len(tea_tags)} tags, fake LLM)",
+        process_file,
+        setup=reset_page,
+    )
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, float]], baseline_path: str, threshold: float
+) -> bool:
+    """
+    Prints how the fastest times changed against a baseline, returns whether any got slower than the threshold
+    """
+    with open(baseline_path, "r") as file:
+        baseline = json.load(file)["results"]
+
+    regressed = False
+    print(f"\nCompared to {baseline_path}:")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["min_us"] / baseline[name]["min_us"]
+        slower = ratio > 1 + threshold
+        regressed = regressed or slower
+        print(f"{name:<40} {ratio:>8.2f}x{'  REGRESSION' if slower else ''}")
+    return regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--files", type=int, default=200, help="Vue files in the project"
+    )
+    parser.add_argument("--sfc-lines", type=int, default=400, help="Lines per Vue file")
+    parser.add_argument("--tags", type=int, default=3, help="<Tea> tags per Vue file")
+    parser.add_argument(
+        "--components",
+        type=int,
+        default=300,
+        help="Components in .nuxt/components.d.ts",
+    )
+    parser.add_argument(
+        "--events", type=int, default=10000, help="File events in a storm"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Save the results to this file")
+    parser.add_argument(
+        "--compare", help="Compare the results to a file saved with --json"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="How much slower counts as a regression",
+    )
+    args = parser.parse_args()
+    log.setLevel(logging.ERROR)
+
+    results = run(args)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(
+                {
+                    "params": {
+                        k: v
+                        for k, v in vars(args).items()
+                        if k not in ("json", "compare")
+                    },
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
@@ -0,0 +1,295 @@
+"""
+Compares models on the prompts Tea actually sends, through the same model wrappers as the watcher.
+
+Every model gets the steep prompt (write a component) and the pour prompt (where to put it) a number of times,
+at a configurable concurrency. It reports the time to the first token, decode tokens per second, p50/p95 latency,
+how often the component came back in a code fence and how often the location parsed as a ComponentLocation.
+The model is configured like the watcher, e.g. with OLLAMA_HOST or OPENAI_KEY:
+
+    python benchmarks/compare_models.py --models deepseek-coder:6.7b-instruct,mistral:v0.2 --output results.json
+    python benchmarks/compare_models.py --stub --concurrency 4 --output results.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+)
+
+from agent import json_mode  # noqa: E402
+from helpers import get_paths_from_tsconfig, log  # noqa: E402
+from langchain_core.messages import AIMessageChunk  # noqa: E402
+from main import create_llm, get_config_from_environment  # noqa: E402
+from ollama_stub import OllamaStub  # noqa: E402
+from prompt import (  # noqa: E402
+    IMPORT_STATEMENT_EXAMPLES,
+    LOGICAL_PATH_EXAMPLES,
+    STOP_SEQUENCES,
+    make_component_output_parser,
+    parse_component_location,
+    write_component_location_prompt,
+    write_component_prompt,
+)
+from streaming import FenceDetector, JsonObjectDetector, get_fenced_code  # noqa: E402
+from tokens import count_tokens  # noqa: E402
+
+MODELS = [
+    "codellama:7b-instruct-q4_0",
+    "codellama:7b-instruct",
+    "codellama:13b-instruct-q4_0",
+    "deepseek-coder:6.7b-instruct-q4_0",
+    "deepseek-coder:6.7b",
+    "deepseek-coder:6.7b-instruct",
+    "mistral:v0.2",
+]
+
+SAMPLE_PARENT = """<script setup lang="ts">
+import Tea from './cup/index/Tea.vue'
+import { ref } from 'vue'
+
+const title = ref('Counter')
+</script>
+
+<template>
+    <main>
+        <h1>{{ title }}</h1>
+        <Tea steep="1">A button that counts how often it was clicked</Tea>
+    </main>
+</template>
+"""
+
+
+def make_sample_project() -> str:
+    """
+    Writes a small project for the prompts to be about
+    """
+    root = tempfile.mkdtemp(prefix="tea-models-")
+    os.makedirs(os.path.join(root, "components"))
+    os.makedirs(os.path.join(root, "pages"))
+    with open(os.path.join(root, "package.json"), "w") as file:
+        json.dump({"dependencies": {"vue": "^3.4.0", "nuxt": "^3.9.0"}}, file)
+    with open(os.path.join(root, "tsconfig.json"), "w") as file:
+        json.dump({"compilerOptions": {"paths": {"~/*": ["./*"]}}}, file)
+    with open(os.path.join(root, "pages", "index.vue"), "w") as file:
+        file.write(SAMPLE_PARENT)
+    return root
+
+
+def make_prompts(root: str) -> Dict[str, str]:
+    parent_path = os.path.join(root, "pages", "index.vue")
+    steep_prompt = write_component_prompt(
+        user_query="A button that counts how often it was clicked",
+        steep_component_content="",
+        parent_file_content=SAMPLE_PARENT,
+        packages={"dependencies": {"vue": "^3.4.0", "nuxt": "^3.9.0"}},
+        source_file=os.path.join(root, "pages", "cup", "index", "Steep1.vue"),
+    )
+    pour_prompt = write_component_location_prompt(
+        make_component_output_parser()
+    ).format(
+        component_name="CounterButton",
+        parent_component_path=parent_path,
+        root_path=root,
+        path_aliases=get_paths_from_tsconfig(root),
+        root_files=os.listdir(root),
+        logical_path_examples=LOGICAL_PATH_EXAMPLES,
+        import_statement_examples=IMPORT_STATEMENT_EXAMPLES,
+    )
+    return {"steep": steep_prompt, "pour": pour_prompt}
+
+
+def check_response(task: str, response: str) -> bool:
+    """
+    Whether Tea could use the response, a component in a code fence or a location it can parse
+    """
+    if task == "steep":
+        code = get_fenced_code(response)
+        return bool(code and "<template" in code)
+    try:
+        return bool(parse_component_location(response))
+    except Exception:
+        return False
+
+
+def run_once(llm, model: str, task: str, prompt: str, timeout: float) -> Dict:
+    """
+    Streams one response like the agent does, until the first code fence (or for pours, JSON object) closes
+    """
+    response = ""
+    detector = FenceDetector() if task == "steep" else JsonObjectDetector()
+    time_to_first_token = None
+    error = None
+    timed_out = False
+    started = time.perf_counter()
+    try:
+        chain = llm.bind(stop=STOP_SEQUENCES) if task == "steep" else json_mode(llm)
+        stream = chain.stream(prompt)
+        try:
+            for chunk in stream:
+                text = chunk.content if isinstance(chunk, AIMessageChunk) else chunk
+                if time_to_first_token is None and text:
+                    time_to_first_token = time.perf_counter() - started
+                response += text
+                if detector.feed(response):
+                    break
+                if time.perf_counter() - started > timeout:
+                    timed_out = True
+                    break
+        finally:
+            stream.close()
+    except Exception as e:
+        error = str(e)
+    latency = time.perf_counter() - started
+
+    completion_tokens = count_tokens(response, model)
+    tokens_per_second = None
+    if time_to_first_token is not None and latency > time_to_first_token:
+        tokens_per_second = completion_tokens / (latency - time_to_first_token)
+    return {
+        "model": model,
+        "task": task,
+        "succeeded": error is None and not timed_out and check_response(task, response),
+        "error": error,
+        "timed_out": timed_out,
+        "time_to_first_token": time_to_first_token,
+        "latency": latency,
+        "prompt_tokens": count_tokens(prompt, model),
+        "completion_tokens": completion_tokens,
+        "tokens_per_second": tokens_per_second,
+    }
+
+
+def percentile(values: List[float], q: float) -> float | None:
+    """
+    Nearest rank percentile, q is between 0 and 100
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(int(round(q / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(runs: List[Dict], wall_seconds: float) -> Dict:
+    ttfts = [r["time_to_first_token"] for r in runs if r["time_to_first_token"]]
+    latencies = [r["latency"] for r in runs if r["error"] is None]
+    rates = [r["tokens_per_second"] for r in runs if r["tokens_per_second"]]
+    return {
+        "model": runs[0]["model"],
+        "task": runs[0]["task"],
+        "runs": len(runs),
+        # Fence extraction for steeps, parsing a ComponentLocation for pours
+        "success_rate": sum(r["succeeded"] for r in runs) / len(runs),
+        "errors": sum(r["error"] is not None for r in runs),
+        "timeouts": sum(r["timed_out"] for r in runs),
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p95": percentile(ttfts, 95),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "tokens_per_second_p50": percentile(rates, 50),
+        "completion_tokens_mean": sum(r["completion_tokens"] for r in runs) / len(runs),
+        "requests_per_minute": len(runs) / wall_seconds * 60 if wall_seconds else None,
+    }
+
+
+def pull(config, model: str):
+    log.info(f"Pulling {model}...")
+    response = requests.post(
+        f"{config.base_url}/api/pull", json={"name": model, "stream": False}
+    )
+    response.raise_for_status()
+
+
+def write_results(path: str, summaries: List[Dict], runs: List[Dict], params: Dict):
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(summaries[0].keys()))
+            writer.writeheader()
+            writer.writerows(summaries)
+        return
+    with open(path, "w") as file:
+        json.dump(
+            {"params": params, "summary": summaries, "runs": runs}, file, indent=2
+        )
+
+
+def format_seconds(value: float | None) -> str:
+    return "-" if value is None else f"{value:.2f}s"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--models", default=",".join(MODELS), help="Comma separated models to compare"
+    )
+    parser.add_argument("--tasks", default="steep,pour")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per model and task")
+    parser.add_argument(
+        "--concurrency", type=int, default=1, help="Requests at once per model"
+    )
+    parser.add_argument("--timeout", type=float, default=45, help="Seconds per run")
+    parser.add_argument("--output", help="Save the results as .json or .csv")
+    parser.add_argument(
+        "--pull", action="store_true", help="Pull every model from Ollama first"
+    )
+    parser.add_argument(
+        "--stub", action="store_true", help="Run against a local stub of Ollama"
+    )
+    args = parser.parse_args()
+
+    root = make_sample_project()
+    os.environ.setdefault("ROOT_DIRECTORY", root)
+    if args.stub:
+        stub = OllamaStub().start()
+        os.environ["OLLAMA_HOST"] = stub.host
+        os.environ.pop("OPENAI_KEY", None)
+    config = get_config_from_environment()
+    prompts = make_prompts(root)
+    tasks = args.tasks.split(",")
+
+    summaries = []
+    all_runs = []
+    for model in args.models.split(","):
+        if args.pull and not config.openai_key:
+            pull(config, model)
+        llm = create_llm(config.model_copy(update={"model": model}))
+        # Warm up, so loading the model doesn't count towards the first run
+        run_once(llm, model, "steep", "Say hi", args.timeout)
+
+        for task in tasks:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                runs = list(
+                    pool.map(
+                        lambda _: run_once(
+                            llm, model, task, prompts[task], args.timeout
+                        ),
+                        range(args.runs),
+                    )
+                )
+            summary = summarize(runs, time.perf_counter() - started)
+            summaries.append(summary)
+            all_runs.extend(runs)
+            print(
+                f"{model} {task}: {summary['success_rate']:.0%} usable, "
+                f"TTFT p50 {format_seconds(summary['ttft_p50'])}, "
+                f"latency p50 {format_seconds(summary['latency_p50'])} "
+                f"p95 {format_seconds(summary['latency_p95'])}, "
+                f"{summary['tokens_per_second_p50'] or 0:.1f} tokens/s",
+                flush=True,
+            )
+
+    if args.output:
+        write_results(args.output, summaries, all_runs, vars(args))
@@ -0,0 +1,211 @@
+"""
+A stand-in for the Ollama API, for running the model comparison without a GPU (e.g. in CI).
+
+It streams a canned component for steep prompts and a canned location for pour prompts,
+at a configurable time to first token and tokens per second, and honors stop sequences like Ollama does:
+
+    python benchmarks/ollama_stub.py --port 11434 --ttft 0.2 --tokens-per-second 50
+"""
+
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COMPONENT_RESPONSE = """Here is the component:
+```vue
+<script setup lang="ts">
+import { ref } from 'vue'
+
+const count = ref(0)
+
+function increment() {
+    count.value++
+}
+</script>
+
+<template>
+    <button class="counter" @click="increment">Clicked {{ count }} times</button>
+</template>
+
+<style scoped>
+.counter {
+    padding: 0.5rem 1rem;
+    border-radius: 0.25rem;
+}
+</style>
+```
+"""
+
+LOCATION_RESPONSE = """```json
+{{"logical_path": "{root}/components/{name}.vue", "import_statement_from_root": "~/components/{name}.vue"}}
+```"""
+
+# Roughly what a tokenizer would split the response into
+TOKEN = re.compile(r"\s*\S{1,4}|\s+")
+
+
+def make_response(prompt: str) -> str:
+    """
+    Answers a location prompt with a location, and anything else with a component
+    """
+    name = re.search(r"new component file called (\w+)\.vue", prompt)
+    if not name:
+        return COMPONENT_RESPONSE
+    root = re.search(r"root path to the project:\s*```\s*(\S+)\s*```", prompt)
+    return LOCATION_RESPONSE.format(
+        root=root.group(1) if root else "/project", name=name.group(1)
+    )
+
+
+def get_json_object(response: str) -> str:
+    return response[response.find("{") : response.rfind("}") + 1]
+
+
+def apply_stop(response: str, stop) -> str:
+    """
+    Cuts the response at the first stop sequence, which isn't part of the response
+    """
+    ends = [response.find(s) for s in stop or [] if s and s in response]
+    return response[: min(ends)] if ends else response
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, body: dict, status: int = 200):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/api/tags":
+            self._send_json({"models": []})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path == "/api/pull":
+            self._read_json()
+            self._send_json({"status": "success"})
+        elif path == "/api/generate":
+            self._generate(self._read_json())
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _generate(self, request: dict):
+        server: OllamaStub = self.server
+        started = time.perf_counter()
+        prompt = request.get("prompt", "")
+        # Without a prompt Ollama only loads (or with a keep_alive of 0, unloads) the model
+        if not prompt:
+            self._send_json(
+                {"model": request.get("model"), "response": "", "done": True}
+            )
+            return
+        stop = request.get("options", {}).get("stop", None)
+        response = apply_stop(make_response(prompt), stop)
+        # JSON mode leaves out the code fence
+        if request.get("format", None) == "json":
+            response = get_json_object(response)
+        tokens = TOKEN.findall(response)
+
+        if request.get("stream", True) is False:
+            time.sleep(server.ttft + len(tokens) / server.tokens_per_second)
+            self._send_json(
+                {"model": request.get("model"), "response": response, "done": True}
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_line(body: dict):
+            data = (json.dumps(body) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            time.sleep(server.ttft)
+            for token in tokens:
+                send_line(
+                    {"model": request.get("model"), "response": token, "done": False}
+                )
+                time.sleep(1 / server.tokens_per_second)
+            send_line(
+                {
+                    "model": request.get("model"),
+                    "response": "",
+                    "done": True,
+                    "prompt_eval_count": len(prompt) // 4,
+                    "eval_count": len(tokens),
+                    "total_duration": int((time.perf_counter() - started) * 1e9),
+                }
+            )
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, like Tea does once the code fence closes
+            pass
+
+
+class OllamaStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ttft: float = 0.05,
+        tokens_per_second: float = 200,
+    ):
+        super().__init__((host, port), OllamaStubHandler)
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+
+    def handle_error(self, request, client_address):
+        # Clients drop the connection whenever they stop reading a stream
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def host(self) -> str:
+        """
+        The host in the format of OLLAMA_HOST
+        """
+        return f"{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self) -> "OllamaStub":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--ttft", type=float, default=0.05, help="Seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=200)
+    args = parser.parse_args()
+
+    stub = OllamaStub(args.host, args.port, args.ttft, args.tokens_per_second)
+    print(f"Serving a stub of the Ollama API on {stub.host}")
+    stub.serve_forever()
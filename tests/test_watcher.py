@@ -0,0 +1,146 @@
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+)
+
+from jobs import JobQueue  # noqa: E402
+from watcher import MAX_WATCHES, FileWatcher  # noqa: E402
+
+# More directories than inotify allows instances by default
+DIRECTORIES = 300
+
+
+def make_directories(root: str, parent: str, count: int) -> str:
+    for i in range(count):
+        os.makedirs(os.path.join(root, parent, f"dir{i}", "nested"))
+    return os.path.join(root, parent, f"dir{count - 1}", "nested")
+
+
+def wait_for_job(jobs: JobQueue, timeout: float = 5) -> str:
+    deadline = time.monotonic() + timeout
+    while not len(jobs) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert len(jobs), "The save was not seen"
+    return jobs.get()
+
+
+def wait_until(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.05)
+
+
+def is_watched(watcher: FileWatcher, path: str) -> bool:
+    return path in watcher.watches or watcher._recursive_watch_of(path) is not None
+
+
+def start_watcher(root: str) -> tuple[FileWatcher, JobQueue]:
+    jobs = JobQueue()
+    watcher = FileWatcher(root, jobs, ignore_patterns=["node_modules"])
+    watcher.start()
+    while not watcher.observer.is_alive() and watcher.thread.is_alive():
+        time.sleep(0.05)
+    assert watcher.observer.is_alive(), "The watcher didn't start"
+    return watcher, jobs
+
+
+def test_watches_deep_trees_with_few_watches(tmp_path):
+    root = str(tmp_path)
+    deepest = make_directories(root, "src", DIRECTORIES)
+    make_directories(root, "node_modules", DIRECTORIES)
+    watcher, jobs = start_watcher(root)
+    try:
+        assert set(watcher.watches) == {root, os.path.join(root, "src")}
+
+        with open(os.path.join(root, "node_modules", "dir0", "index.vue"), "w") as f:
+            f.write("<template></template>")
+        file_path = os.path.join(deepest, "Card.vue")
+        with open(file_path, "w") as f:
+            f.write("<template></template>")
+        assert wait_for_job(jobs) == file_path
+        assert not len(jobs)
+    finally:
+        watcher.stop()
+
+
+def test_follows_new_directories(tmp_path):
+    root = str(tmp_path)
+    os.makedirs(os.path.join(root, "src"))
+    os.makedirs(os.path.join(root, "node_modules"))
+    watcher, jobs = start_watcher(root)
+    try:
+        make_directories(root, "pages", 1)
+        file_path = os.path.join(root, "pages", "dir0", "nested", "Index.vue")
+        wait_until(lambda: is_watched(watcher, os.path.dirname(file_path)))
+        with open(file_path, "w") as f:
+            f.write("<template></template>")
+        assert wait_for_job(jobs) == file_path
+    finally:
+        watcher.stop()
+
+
+def test_leaves_out_nested_ignored_trees(tmp_path):
+    root = str(tmp_path)
+    for path in ["a/node_modules/lib", "a/src/components", "b/src"]:
+        os.makedirs(os.path.join(root, "packages", path))
+    watcher, jobs = start_watcher(root)
+    try:
+        packages = os.path.join(root, "packages")
+        assert watcher.watches.keys() == {
+            root,
+            packages,
+            os.path.join(packages, "a"),
+            os.path.join(packages, "a", "src"),
+            os.path.join(packages, "b"),
+        }
+        assert not is_watched(watcher, os.path.join(packages, "a", "node_modules"))
+        assert is_watched(watcher, os.path.join(packages, "a", "src", "components"))
+    finally:
+        watcher.stop()
+
+
+def test_splits_a_watch_around_a_new_ignored_tree(tmp_path):
+    root = str(tmp_path)
+    deepest = make_directories(root, "src", 2)
+    watcher, jobs = start_watcher(root)
+    try:
+        assert list(watcher.watches) == [root]
+        node_modules = os.path.join(root, "src", "dir0", "node_modules")
+        os.makedirs(os.path.join(node_modules, "lib"))
+        wait_until(
+            lambda: root not in watcher.watches
+            or not watcher.watches[root].is_recursive
+        )
+        wait_until(lambda: is_watched(watcher, deepest))
+        assert not is_watched(watcher, node_modules)
+
+        file_path = os.path.join(deepest, "Card.vue")
+        with open(file_path, "w") as f:
+            f.write("<template></template>")
+        assert wait_for_job(jobs) == file_path
+    finally:
+        watcher.stop()
+
+
+def test_never_watches_ignored_trees_past_the_limit(tmp_path, caplog):
+    root = str(tmp_path)
+    make_directories(root, "", DIRECTORIES)
+    os.makedirs(os.path.join(root, "node_modules", "lib"))
+    watcher, jobs = start_watcher(root)
+    try:
+        assert DIRECTORIES > MAX_WATCHES
+        assert len(watcher.watches) == MAX_WATCHES
+        assert not is_watched(watcher, os.path.join(root, "node_modules"))
+        assert "Not watching" in caplog.text
+
+        watched = next(p for p in watcher.watches if p != root)
+        file_path = os.path.join(watched, "nested", "Card.vue")
+        with open(file_path, "w") as f:
+            f.write("<template></template>")
+        assert wait_for_job(jobs) == file_path
+    finally:
+        watcher.stop()